@@ -0,0 +1,136 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+import backup
+import export
+import metrics
+
+# Storage calls run on these worker threads so the discord.py event loop never
+# waits on disk I/O. Each worker keeps its own persistent connections.
+DB_WORKERS = 4
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+
+# The storage backend all wrappers call into. bot.py picks it at startup with use_backend().
+_backend = None
+
+def use_backend(backend):
+    global _backend
+    _backend = backend
+
+# Leaderboards are cached for this many seconds. Any write that changes worked
+# time clears the cache, so a cached result is never older than the data.
+LEADERBOARD_TTL = 300
+_leaderboard_cache = {}  # (guild_id, start_date, end_date, limit, ascending) -> (expires_at, rows)
+_leaderboard_generation = 0
+
+def invalidate_leaderboard():
+    global _leaderboard_generation
+    _leaderboard_generation += 1
+    _leaderboard_cache.clear()
+
+def _timed(name, func, *args, **kwargs):
+    """Run a storage call on a worker and record how long it took to execute."""
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        metrics.observe_query(name, time.perf_counter() - started)
+
+def _awaitable(name):
+    """Wrap a blocking storage operation of the current backend so it can be awaited."""
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(_timed, name, getattr(_backend, name), *args, **kwargs))
+    wrapper.__name__ = name
+    return wrapper
+
+def _invalidating(name):
+    """Wrap a storage operation that changes worked time so it clears the leaderboard cache."""
+    call = _awaitable(name)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            invalidate_leaderboard()
+    wrapper.__name__ = name
+    return wrapper
+
+init_db = _awaitable('init_db')
+claim_unassigned_rows = _invalidating('claim_unassigned_rows')
+get_guild_settings = _awaitable('get_guild_settings')
+set_guild_setting = _awaitable('set_guild_setting')
+get_base_timestamp = _awaitable('get_base_timestamp')
+set_base_timestamp = _awaitable('set_base_timestamp')
+add_job = _awaitable('add_job')
+get_jobs = _awaitable('get_jobs')
+set_job_next_run = _awaitable('set_job_next_run')
+remove_job = _awaitable('remove_job')
+add_clock_in = _awaitable('add_clock_in')
+add_session = _invalidating('add_session')
+update_clock_out = _invalidating('update_clock_out')
+get_clock_times = _awaitable('get_clock_times')
+get_worked_report = _awaitable('get_worked_report')
+get_range_report = _awaitable('get_range_report')
+rebuild_daily_totals = _invalidating('rebuild_daily_totals')
+get_ongoing_sessions = _awaitable('get_ongoing_sessions')
+remove_session = _invalidating('remove_session')
+_get_leaderboard = _awaitable('get_leaderboard')
+archive_sessions = _awaitable('archive_sessions')
+get_archive_summary = _awaitable('get_archive_summary')
+incremental_vacuum = _awaitable('incremental_vacuum')
+get_punish_count = _awaitable('get_punish_count')
+reset_punish_count = _awaitable('reset_punish_count')
+increment_punish_count = _awaitable('increment_punish_count')
+get_warning_history = _awaitable('get_warning_history')
+
+async def get_leaderboard(guild_id, start_date, end_date, limit=10, ascending=False):
+    """Rank users by worked time, serving repeated requests from the cache until it expires or is invalidated."""
+    key = (guild_id, start_date, end_date, limit, ascending)
+    entry = _leaderboard_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    generation = _leaderboard_generation
+    rows = await _get_leaderboard(guild_id, start_date, end_date, limit, ascending)
+    # A write that finished while the query ran may not be in the result, so only cache it if there was none
+    if generation == _leaderboard_generation:
+        _leaderboard_cache[key] = (time.monotonic() + LEADERBOARD_TTL, rows)
+    return rows
+
+def _export_timesheet(guild_id, start_date, end_date, export_format='csv'):
+    return export.export_timesheet(_backend.iter_sessions(guild_id, start_date, end_date), export_format)
+
+# Exports read through the backend's connections, so they run on the same workers
+async def export_timesheet(guild_id, start_date, end_date, export_format='csv'):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(_timed, 'export_timesheet', _export_timesheet,
+                                                                   guild_id, start_date, end_date, export_format))
+
+def supports_backups():
+    return _backend.supports_backups
+
+def _backup_database(directory, keep, prefix=backup.SNAPSHOT_PREFIX):
+    return backup.create_snapshot(_backend.backup_database, directory, keep, prefix)
+
+def _restore_database(directory, name):
+    _backend.restore_database(backup.verified_snapshot(directory, name))
+
+# Backups copy a few pages per step on one worker, so the other workers keep serving queries meanwhile
+async def backup_database(directory, keep, prefix=backup.SNAPSHOT_PREFIX):
+    """Snapshot the database into directory, keeping the newest `keep` snapshots. Returns (name, pages, checksum)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(_timed, 'backup_database', _backup_database, directory, keep, prefix))
+
+async def restore_database(directory, name):
+    """Replace the database with a snapshot after checking its checksum. Raises ValueError for a missing or changed snapshot."""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_executor, functools.partial(_timed, 'restore_database', _restore_database, directory, name))
+    finally:
+        invalidate_leaderboard()
+
+def shutdown():
+    """Wait for queued queries to finish, then close the backend."""
+    _executor.shutdown(wait=True)
+    if _backend is not None:
+        _backend.close()
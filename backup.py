@@ -0,0 +1,74 @@
+import datetime
+import hashlib
+import os
+
+SNAPSHOT_PREFIX = 'clock_times'  # snapshots are named clock_times-YYYYMMDD-HHMMSS.db
+UNDO_PREFIX = 'pre-restore'  # snapshots of the data replaced by a restore, kept apart so scheduled ones do not rotate them out
+CHECKSUM_SUFFIX = '.sha256'
+
+def file_checksum(path):
+    """Return the SHA-256 of a file, read in chunks so large snapshots are never held in memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_checksum(path):
+    """Return the checksum stored next to a snapshot, or None if there is none"""
+    try:
+        with open(path + CHECKSUM_SUFFIX, encoding='utf-8') as file:
+            return file.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+def list_snapshots(directory, prefix=SNAPSHOT_PREFIX):
+    """Return (name, size in bytes, checksum) of every snapshot in directory, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((name for name in os.listdir(directory) if name.startswith(f"{prefix}-") and name.endswith('.db')), reverse=True)
+    return [(name, os.path.getsize(os.path.join(directory, name)), read_checksum(os.path.join(directory, name))) for name in names]
+
+def create_snapshot(backup, directory, keep, prefix=SNAPSHOT_PREFIX):
+    """Make a new snapshot with backup(path), store its checksum and delete all but the newest `keep` snapshots.
+
+    The snapshot is written under a temporary name and renamed once it is
+    complete, so a snapshot in the directory is never a partial copy. Returns
+    (name, pages copied, checksum).
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{prefix}-{datetime.datetime.now():%Y%m%d-%H%M%S}.db"
+    path = os.path.join(directory, name)
+    temp_path = f"{path}.tmp"
+    try:
+        pages = backup(temp_path)
+        checksum = file_checksum(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    # The same format as sha256sum, so a snapshot can also be checked with `sha256sum -c`
+    with open(path + CHECKSUM_SUFFIX, 'w', encoding='utf-8') as file:
+        file.write(f"{checksum}  {name}\n")
+
+    for old_name, _, _ in list_snapshots(directory, prefix)[keep:]:
+        old_path = os.path.join(directory, old_name)
+        os.remove(old_path)
+        if os.path.exists(old_path + CHECKSUM_SUFFIX):
+            os.remove(old_path + CHECKSUM_SUFFIX)
+    return name, pages, checksum
+
+def verified_snapshot(directory, name):
+    """Return the path of a snapshot after checking it against its stored checksum.
+
+    Raises ValueError if there is no such snapshot or its contents changed since it was made.
+    """
+    if os.path.basename(name) != name or not os.path.isfile(os.path.join(directory, name)):
+        raise ValueError(f"There is no snapshot {name}.")
+    path = os.path.join(directory, name)
+    expected = read_checksum(path)
+    if expected is None:
+        raise ValueError(f"Snapshot {name} has no checksum.")
+    if file_checksum(path) != expected:
+        raise ValueError(f"Snapshot {name} does not match its checksum.")
+    return path
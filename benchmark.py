@@ -0,0 +1,271 @@
+"""Benchmark the storage layer and the command handlers offline.
+
+Seeds a fresh database with USERS users and DAYS days of history, then times
+the storage calls and the bot.py command callbacks behind clockin, clockout,
+worked, top, ongoing and warn, and prints latency percentiles and throughput.
+Commands run against fake guild, member and channel objects, so no Discord
+connection or token is needed. Everything is stored for guild GUILD_ID.
+
+    python benchmark.py --users 200 --days 90 --backend sqlite
+"""
+import argparse
+import asyncio
+import datetime
+import functools
+import os
+import random
+import statistics
+import tempfile
+import time
+import database
+from storage import SQLiteBackend
+from async_database import get_ongoing_sessions, remove_session
+
+GUILD_ID = 1
+
+class Role:
+    def __init__(self, role_id, name):
+        self.id = role_id
+        self.name = name
+        self.mention = f"<@&{role_id}>"
+
+class Message:
+    async def delete(self):
+        pass
+
+    async def edit(self, **kwargs):
+        pass
+
+class Channel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+
+    async def send(self, content=None, **kwargs):
+        return Message()
+
+class Member:
+    def __init__(self, user_id, guild, roles):
+        self.id = user_id
+        self.guild = guild
+        self.roles = roles
+        self.bot = False
+        self.name = self.display_name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content=None, **kwargs):
+        return Message()
+
+class Guild:
+    def __init__(self, roles):
+        self.id = GUILD_ID
+        self.owner_id = 0
+        self.name = "benchmark"
+        self.roles = roles
+        self.members = {}
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    def get_channel(self, channel_id):
+        return Channel(channel_id)
+
+class Context:
+    """The parts of commands.Context the command callbacks use, for a prefix command"""
+    interaction = None
+
+    def __init__(self, author, channel_id):
+        self.author = author
+        self.guild = author.guild
+        self.channel = Channel(channel_id)
+        self.message = Message()
+
+    async def send(self, content=None, **kwargs):
+        return Message()
+
+    async def defer(self, **kwargs):
+        pass
+
+# Placeholder config so bot.py can be imported without a .env file
+BENCHMARK_ENV = {
+    'BOT_TOKEN': 'benchmark',
+    'ALLOWED_CHANNEL_ID': '1',
+    'ALLOWED_ADMIN_CHANNEL_ID': '2',
+    'LOG_CHANNEL_ID': '3',
+    'RENEW_CHANNEL_ID': '4',
+    'ALLOWED_PUNISH_CHANNEL_ID': '5',
+    'REQUIRED_PD_ROLE_NAME': 'PD',
+    'REQUIRED_HR_ROLE_NAME': 'HR',
+    'REQUIRED_PD_SPECIFIC_ROLE_NAME': 'ASP',
+    'LOGS_TAG_ROLE_NAME': 'Conducere',
+    'ATRIBUTII_ROLE_NAME': 'Atributii',
+    'LEGACY_GUILD_ID': '1',  # the benchmark guild, so it uses the settings above
+}
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+class Results:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, name, latencies, elapsed):
+        latencies = sorted(latencies)
+        self.rows.append((name, len(latencies), statistics.mean(latencies), percentile(latencies, 0.5),
+                          percentile(latencies, 0.95), percentile(latencies, 0.99), latencies[-1],
+                          len(latencies) / elapsed if elapsed else float('inf')))
+
+    def print(self):
+        print(f"{'benchmark':<32}{'n':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'ops/s':>11}")
+        for name, count, mean, p50, p95, p99, worst, throughput in self.rows:
+            print(f"{name:<32}{count:>7}{mean * 1000:>10.3f}{p50 * 1000:>10.3f}{p95 * 1000:>10.3f}"
+                  f"{p99 * 1000:>10.3f}{worst * 1000:>10.3f}{throughput:>11.1f}")
+
+def measure(results, name, calls):
+    """Time each call in a list of blocking storage calls"""
+    latencies = []
+    started = time.perf_counter()
+    for call in calls:
+        call_started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_started)
+    results.add(name, latencies, time.perf_counter() - started)
+
+async def measure_async(results, name, calls, concurrency=1):
+    """Time each call in a list of coroutine calls, running up to `concurrency` of them at once"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(call):
+        async with semaphore:
+            call_started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - call_started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    results.add(name, latencies, time.perf_counter() - started)
+
+def seed(storage, user_ids, days, today):
+    """Store one or two finished sessions per user for each of the last `days` days, today included"""
+    rng = random.Random(0)
+    sessions = []
+    for offset in range(days):
+        day = datetime.datetime.combine(today - datetime.timedelta(days=offset), datetime.time(8))
+        for user_id in user_ids:
+            clock_in = day + datetime.timedelta(minutes=rng.randrange(0, 180))
+            for _ in range(rng.choice((1, 2))):
+                clock_out = clock_in + datetime.timedelta(minutes=rng.randrange(20, 240))
+                sessions.append((user_id, clock_in, clock_out))
+                clock_in = clock_out + datetime.timedelta(minutes=rng.randrange(10, 60))
+
+    if isinstance(storage, SQLiteBackend):
+        # One transaction instead of a commit per session
+        conn = database.get_connection(database.DB_PATH)
+        with conn:
+            conn.executemany("INSERT INTO clock_times (guild_id, user_id, date, start_ts, end_ts, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                             ((GUILD_ID, user_id, clock_in.strftime("%Y-%m-%d"), database.to_timestamp(clock_in),
+                               database.to_timestamp(clock_out), database.to_timestamp(clock_out) - database.to_timestamp(clock_in))
+                              for user_id, clock_in, clock_out in sessions))
+        storage.rebuild_daily_totals()
+    else:
+        for session in sessions:
+            storage.add_session(GUILD_ID, *session)
+    return len(sessions)
+
+def benchmark_storage(results, storage, user_ids, today):
+    now = datetime.datetime.now()
+    date = today.strftime("%Y-%m-%d")
+    month_start = today.replace(day=1).strftime("%Y-%m-%d")
+    later = now + datetime.timedelta(hours=1)
+
+    measure(results, "db add_clock_in", [functools.partial(storage.add_clock_in, GUILD_ID, user_id, now) for user_id in user_ids])
+    measure(results, "db get_ongoing_sessions", [functools.partial(storage.get_ongoing_sessions, GUILD_ID)] * 50)
+    measure(results, "db update_clock_out", [functools.partial(storage.update_clock_out, GUILD_ID, user_id, later) for user_id in user_ids])
+    measure(results, "db get_clock_times", [functools.partial(storage.get_clock_times, GUILD_ID, user_id, date) for user_id in user_ids])
+    measure(results, "db get_worked_report (day)", [functools.partial(storage.get_worked_report, GUILD_ID, date)] * 50)
+    measure(results, "db get_worked_report (user)", [functools.partial(storage.get_worked_report, GUILD_ID, date, user_id) for user_id in user_ids])
+    measure(results, "db get_range_report (month)", [functools.partial(storage.get_range_report, GUILD_ID, month_start, date)] * 50)
+    measure(results, "db get_leaderboard (month)", [functools.partial(storage.get_leaderboard, GUILD_ID, month_start, date)] * 50)
+    measure(results, "db increment_punish_count", [functools.partial(storage.increment_punish_count, GUILD_ID, user_id, 0, "benchmark", 5) for user_id in user_ids])
+    measure(results, "db get_warning_history", [functools.partial(storage.get_warning_history, GUILD_ID, user_id) for user_id in user_ids])
+    measure(results, "db reset_punish_count", [functools.partial(storage.reset_punish_count, GUILD_ID, user_id, 0, "benchmark") for user_id in user_ids])
+
+async def benchmark_commands(results, bot, members, issuer, concurrency):
+    import common  # reads the config, so only import it once the environment is set up
+
+    bot.bot.loop = asyncio.get_running_loop()
+    for extension in bot.EXTENSIONS:
+        await bot.bot.load_extension(extension)
+
+    def command(name, *args, **kwargs):
+        cmd = bot.bot.get_command(name)
+        return functools.partial(cmd.callback, cmd.cog, *args, **kwargs)
+
+    config = common.get_config(GUILD_ID)
+    clock_contexts = [Context(member, config.clock_channel) for member in members]
+    admin = Context(issuer, config.admin_channel)
+    punish = Context(issuer, config.punish_channel)
+    ongoing = Context(issuer, config.clock_channel)
+
+    # Finished sessions from the storage benchmark would make every clockout a no-op, so start clean
+    for session_id, _, _, _ in await get_ongoing_sessions(GUILD_ID):
+        await remove_session(session_id)
+
+    await measure_async(results, "/clockin", [command("clockin", ctx) for ctx in clock_contexts], concurrency)
+    await measure_async(results, "/ongoing", [command("ongoing", ongoing)] * 20)
+    await measure_async(results, "/clockout", [command("clockout", ctx) for ctx in clock_contexts], concurrency)
+    await measure_async(results, "/worked (today)", [command("worked", admin)] * 20)
+    await measure_async(results, "/worked (month)", [command("worked", admin, "month")] * 20)
+    await measure_async(results, "/worked (month, one user)", [command("worked", admin, "month", member) for member in members[:50]])
+    await measure_async(results, "/top (month, cached)", [command("top", admin, "month")] * 20)
+    await measure_async(results, "/warn", [command("warn", punish, member, message="benchmark warning") for member in members], concurrency)
+    await measure_async(results, "/warn history", [command("warn", punish, member, message="history") for member in members], concurrency)
+    await measure_async(results, "/warn reset", [command("warn", punish, member, message="reset benchmark") for member in members], concurrency)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100, help="number of seeded users (default: 100)")
+    parser.add_argument('--days', type=int, default=30, help="days of history per user (default: 30)")
+    parser.add_argument('--backend', choices=('sqlite', 'memory'), default='sqlite', help="storage backend (default: sqlite)")
+    parser.add_argument('--concurrency', type=int, default=10, help="commands run at the same time (default: 10)")
+    args = parser.parse_args()
+
+    # Run in a scratch directory so the database and bot.log of the real bot are never touched
+    workdir = tempfile.mkdtemp(prefix='pontaje-benchmark-')
+    os.chdir(workdir)
+    for key, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ['STORAGE_BACKEND'] = args.backend
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'benchmark.db')
+
+    import bot
+
+    roles = [Role(10, 'PD'), Role(11, 'HR'), Role(12, 'Conducere'), Role(13, 'Atributii'), Role(14, 'ASP')]
+    guild = Guild(roles)
+    user_ids = list(range(1000, 1000 + args.users))
+    members = [Member(user_id, guild, [roles[0]]) for user_id in user_ids]
+    guild.members = {member.id: member for member in members}
+    issuer = Member(1, guild, roles[1:3])
+    guild.members[issuer.id] = issuer
+
+    today = datetime.date.today()
+    started = time.perf_counter()
+    count = seed(bot.storage, user_ids, args.days, today)
+    print(f"Seeded {count} sessions for {args.users} users over {args.days} days "
+          f"into the {args.backend} backend in {time.perf_counter() - started:.2f}s ({workdir})\n")
+
+    results = Results()
+    benchmark_storage(results, bot.storage, user_ids, today)
+    asyncio.run(benchmark_commands(results, bot, members, issuer, args.concurrency))
+    results.print()
+    bot.shutdown_db()
+
+if __name__ == '__main__':
+    main()
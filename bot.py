@@ -1,53 +1,227 @@
 import logging
 import asyncio
-from dotenv import load_dotenv
-import os
 import datetime
+import os
+import time
+from collections import deque
 import discord
+from discord import app_commands
 from discord.ext import commands
-from discord.ext.commands import cooldown, BucketType
 from discord.ext.commands import CommandOnCooldown
-from database import init_db, add_clock_in, update_clock_out, get_clock_times, get_ongoing_sessions, remove_session, get_base_timestamp, set_base_timestamp, increment_punish_count, get_punish_count, reset_punish_count
+import common
+from storage import create_backend
+from scheduler import Scheduler
+import metrics
+from logging_config import setup_logging
+from async_database import use_backend, claim_unassigned_rows, shutdown as shutdown_db
+from common import (LOGS_CHANNEL_ID, MAX_MESSAGE_LENGTH, pack_messages, UserResolver, refresh_role_ids, get_role_ids, get_role,
+                    member_role_ids, send_temporary, load_guild_configs, set_legacy_guild, configured_channel, is_bot_owner)
 
-# Load environment variables from .env file
-load_dotenv()
 TOKEN = os.getenv('BOT_TOKEN')
-ALLOWED_CHANNEL_ID = int(os.getenv('ALLOWED_CHANNEL_ID'))
-ALLOWED_ADMIN_CHANNEL_ID = int(os.getenv('ALLOWED_ADMIN_CHANNEL_ID'))
-REQUIRED_PD_ROLE_NAME = os.getenv('REQUIRED_PD_ROLE_NAME')
-REQUIRED_HR_ROLE_NAME = os.getenv('REQUIRED_HR_ROLE_NAME')
-REQUIRED_PD_SPECIFIC_ROLE_NAME = os.getenv('REQUIRED_PD_SPECIFIC_ROLE_NAME').split(',')
-LOGS_CHANNEL_ID = int(os.getenv('LOG_CHANNEL_ID'))
-LOGS_TAG_ROLE_NAME = os.getenv('LOGS_TAG_ROLE_NAME')
-RENEW_CHANNEL_ID = int(os.getenv('RENEW_CHANNEL_ID'))
-ALLOWED_PUNISH_CHANNEL_ID = int(os.getenv('ALLOWED_PUNISH_CHANNEL_ID'))
-ATRIBUTII_ROLE_NAME=os.getenv('ATRIBUTII_ROLE_NAME')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')  # 'sqlite', or 'memory' for load tests and benchmarks
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'clock_times.db')
+METRICS_FILE = os.getenv('METRICS_FILE', 'metrics.prom')  # Prometheus text file, rewritten every METRICS_INTERVAL seconds
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', 60))
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text', or 'json' for one structured record per line
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))  # size at which bot.log is rotated
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN')  # e.g. 'midnight' to rotate by time instead of size
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0)) or None  # Discord's recommended shard count is used when not set
+ARCHIVE_INTERVAL_HOURS = float(os.getenv('ARCHIVE_INTERVAL_HOURS', 24))  # how often old sessions are archived, 0 to turn it off
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', 24))  # how often the database is snapshotted, 0 to turn it off
+EXTENSIONS = [f"cogs.{name.strip()}" for name in os.getenv('EXTENSIONS', 'clocking,hr,punishments,scheduling,admin').split(',') if name.strip()]  # command modules loaded at startup
 
 # Initialize database
-init_db()
-
-logging.basicConfig(filename='bot.log', level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+storage = create_backend(STORAGE_BACKEND, DATABASE_PATH)
+storage.init_db()
+use_backend(storage)
 
 class DiscordHandler(logging.Handler):
-    def __init__(self, bot, channel_id):
+    """Ship log records to Discord channels in batches.
+
+    Records are buffered and sent every flush_interval seconds by a single task,
+    packed into as few messages as fit in Discord's message size limit. A record
+    logged while handling a guild's command goes to that guild's own logs
+    channel, any other record to channel_id. Records of a guild without a logs
+    channel are only kept in the log file. When more than max_pending records
+    are waiting, new ones are dropped and a summary of how many were lost is
+    sent with the next batch.
+    """
+    def __init__(self, bot, channel_id, flush_interval=2.0, max_pending=200):
         super().__init__()
         self.bot = bot
         self.channel_id = channel_id
-
-    async def send_log(self, message):
-        channel = self.bot.get_channel(self.channel_id)
-        if channel:
-            await channel.send(message)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.dropped = 0
+        self.flush_task = None
 
     def emit(self, record):
-        log_entry = self.format(record)
-        self.bot.loop.create_task(self.send_log(log_entry))
+        # handle() already holds self.lock, so records from any thread queue up safely
+        try:
+            log_entry = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+        else:
+            self.pending.append((getattr(record, 'guild_id', None), log_entry[:MAX_MESSAGE_LENGTH]))
+
+    def channel_for(self, guild_id):
+        if not guild_id:
+            return self.bot.get_channel(self.channel_id)
+        guild = self.bot.get_guild(guild_id)
+        return configured_channel(guild, 'logs_channel') if guild else None
+
+    async def send_pending(self):
+        # Channels cannot be resolved before the bot is ready, so records wait until then
+        if not self.bot.is_ready():
+            return
+        self.acquire()
+        try:
+            entries = list(self.pending)
+            self.pending.clear()
+            dropped, self.dropped = self.dropped, 0
+        finally:
+            self.release()
+
+        batches = {}
+        unrouted = 0
+        for guild_id, entry in entries:
+            channel = self.channel_for(guild_id)
+            if channel is None:
+                unrouted += 1
+            else:
+                batches.setdefault(channel, []).append(entry)
+        fallback = self.bot.get_channel(self.channel_id)
+        if fallback is not None:
+            if dropped:
+                batches.setdefault(fallback, []).append(f"... {dropped} log messages were dropped because too many were logged at once.")
+            if unrouted:
+                batches.setdefault(fallback, []).append(f"... {unrouted} log messages from servers without a logs channel were only written to the log file.")
+
+        # Messages go out one at a time, so discord.py's rate limit handling can pace them
+        for channel, channel_entries in batches.items():
+            for message in pack_messages(channel_entries):
+                try:
+                    await channel.send(message)
+                except discord.HTTPException:
+                    self.acquire()
+                    self.dropped += 1
+                    self.release()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.send_pending()
+
+    def start(self):
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the flush task and send whatever is still buffered"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.send_pending()
 
 # Define bot and command prefix
 intents = discord.Intents.default()
 intents.members = True  # Enable member intents
 intents.message_content = True  # Enable message content intent
-bot = commands.Bot(command_prefix="/", intents=intents)
+
+class PontajeTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction):
+        # Slash commands do not go through Bot.invoke, so tag and time them here
+        if interaction.command:
+            metrics.current_command.set(interaction.command.qualified_name)
+            metrics.current_guild.set(interaction.guild_id)
+            interaction.extras['started'] = time.perf_counter()
+        return True
+
+def observe_interaction(ctx):
+    """Record the latency of a slash command once it has completed or failed"""
+    if ctx.interaction and 'started' in ctx.interaction.extras:
+        metrics.observe_command(ctx.command.qualified_name, time.perf_counter() - ctx.interaction.extras['started'])
+
+class PontajeBot(commands.AutoShardedBot):
+    """The bot process. Commands live in the extensions under cogs/ and can be reloaded without reconnecting.
+
+    One process serves every guild the bot is in, over as many gateway shards
+    as Discord recommends, or SHARD_COUNT. State that has to survive a reload,
+    like the scheduler and the user cache, is kept on the bot instead of in the
+    extension modules.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http.request = metrics.counted_requests(self.http.request)
+        self.scheduler = Scheduler()
+        self.user_resolver = UserResolver(self)
+        self.legacy_claimed = False
+
+    async def setup_hook(self):
+        discord_handler.start()
+        metrics_writer.start()
+        await load_guild_configs()
+        # Extensions register the scheduler's job handlers, so load them before the jobs
+        for extension in EXTENSIONS:
+            await self.load_extension(extension)
+        await self.scheduler.load()
+        await self.schedule_maintenance()
+        self.scheduler.start()
+
+    async def schedule_maintenance(self):
+        """Schedule the recurring maintenance jobs that are turned on and not scheduled yet"""
+        backup_hours = BACKUP_INTERVAL_HOURS if storage.supports_backups else 0
+        for kind, hours in (('archive_sessions', ARCHIVE_INTERVAL_HOURS), ('backup_database', backup_hours)):
+            if hours <= 0 or self.scheduler.get_jobs(kind=kind):
+                continue
+            # These jobs act on every guild, so they are stored without one. The first run leaves startup alone.
+            first_run = datetime.datetime.now() + datetime.timedelta(minutes=10)
+            job_id = await self.scheduler.schedule(0, kind, first_run, datetime.timedelta(hours=hours))
+            logging.info(f"Scheduled the {kind} job #{job_id} every {hours:g} hours.")
+
+    async def invoke(self, ctx):
+        # API calls made while handling the command, including by tasks it starts, are counted against it
+        name = ctx.command.qualified_name if ctx.command else None
+        metrics.current_command.set(name)
+        metrics.current_guild.set(ctx.guild.id if ctx.guild else None)
+        started = time.perf_counter()
+        try:
+            await super().invoke(ctx)
+        finally:
+            if name:
+                metrics.observe_command(name, time.perf_counter() - started)
+
+    def legacy_guild_id(self):
+        """Return the guild that owns the data stored before the bot served several guilds, if it is known"""
+        return common.legacy_guild_id or (self.guilds[0].id if len(self.guilds) == 1 else None)
+
+    async def claim_legacy_rows(self, guild_id=None):
+        """Give the data stored before the bot served several guilds to guild_id, by default the legacy guild"""
+        guild_id = guild_id or self.legacy_guild_id()
+        if guild_id is None:
+            logging.info("Set LEGACY_GUILD_ID to assign the data stored before the bot served several guilds to a guild.")
+            return 0
+        if guild_id != common.legacy_guild_id:
+            await set_legacy_guild(guild_id)
+        claimed = await claim_unassigned_rows(guild_id)
+        self.scheduler.claim(guild_id)
+        if claimed:
+            logging.info(f"Assigned {claimed} sessions stored before the bot served several guilds to guild {guild_id}.")
+        return claimed
+
+    async def close(self):
+        self.scheduler.stop()
+        await metrics_writer.stop()
+        await discord_handler.stop()
+        await super().close()
+
+bot = PontajeBot(command_prefix="/", intents=intents, tree_cls=PontajeTree, shard_count=SHARD_COUNT)
 
 # Add the custom handler to the logger
 discord_handler = DiscordHandler(bot, LOGS_CHANNEL_ID)
@@ -57,573 +231,125 @@ discord_handler.setFormatter(formatter)
 # Set a specific log level for the Discord handler
 discord_handler.setLevel(logging.WARNING)  # Only send WARNING and above to Discord
 
-# Add handlers to the logger
-logger = logging.getLogger()
-logger.addHandler(discord_handler)
+# Log through a queue so commands never wait on the log file
+log_listener = setup_logging([discord_handler], LOG_FILE, json_format=LOG_FORMAT == 'json', max_bytes=LOG_MAX_BYTES,
+                             backup_count=LOG_BACKUP_COUNT, rotate_when=LOG_ROTATE_WHEN)
+
+metrics_writer = metrics.MetricsWriter(METRICS_FILE, METRICS_INTERVAL)
+
+@bot.event
+async def on_command_completion(ctx):
+    observe_interaction(ctx)
 
 @bot.event
 async def on_command_error(ctx, error):
+    observe_interaction(ctx)
     if isinstance(error, CommandOnCooldown):
-        await ctx.send(f"{ctx.author.mention}, this command is on cooldown. Try again in {error.retry_after:.2f} seconds.", delete_after=3)
+        metrics.cooldown_rejections[ctx.command.name] += 1
+        await send_temporary(ctx, f"{ctx.author.mention}, this command is on cooldown. Try again in {error.retry_after:.2f} seconds.")
     elif isinstance(error, commands.CommandNotFound):
         await ctx.send(f"{ctx.author.mention}, this command does not exist.", delete_after=3)
     else:
-        await ctx.send(f"{ctx.author.mention}, an error occurred: {str(error)}", delete_after=3)
+        await send_temporary(ctx, f"{ctx.author.mention}, an error occurred: {str(error)}")
         logging.error(f"An error occurred: {str(error)}")
 
 @bot.event
 async def on_member_update(before, after):
-    hr_role = discord.utils.get(after.guild.roles, name=REQUIRED_HR_ROLE_NAME)
-    pd_role = discord.utils.get(after.guild.roles, name=REQUIRED_PD_ROLE_NAME)
-    atributii_role=discord.utils.get(after.guild.roles, name=ATRIBUTII_ROLE_NAME)
-    if hr_role and hr_role not in before.roles and hr_role in after.roles:
-        logging.info(f"User {after.mention} received the {hr_role.mention} role.")
-        channel = bot.get_channel(LOGS_CHANNEL_ID)
-        role = discord.utils.get(after.guild.roles, name=LOGS_TAG_ROLE_NAME)
-        if channel:
-            await channel.send(f"|| {role.mention} || User {after.mention} received the {hr_role.mention} role.")
-        channel = bot.get_channel(LOGS_CHANNEL_ID)
-        role = discord.utils.get(after.guild.roles, name=LOGS_TAG_ROLE_NAME)
-        if channel:
-            await channel.send(f"|| {role.mention} || User {after.mention} received the {pd_role.mention} role.")
-    
-    if pd_role and pd_role not in before.roles and pd_role in after.roles:
-        if atributii_role and atributii_role not in after.roles:
-            await after.add_roles(atributii_role)
-            logging.info(f"User {after.mention} received the {pd_role.mention} and {atributii_role.mention} role.")
-            channel = bot.get_channel(LOGS_CHANNEL_ID)
-            role = discord.utils.get(after.guild.roles, name=LOGS_TAG_ROLE_NAME)
-            if channel:
-                await channel.send(f"|| {role.mention} || User {after.mention} received the {pd_role.mention} and {atributii_role.mention} role.")
-
-scheduled_task = None
-
-@bot.event
-async def on_ready():
-    global scheduled_task
-
-    print(f"Logged in as {bot.user}")
-    base_timestamp = get_base_timestamp()
-
-    if base_timestamp:
-        if scheduled_task is None or scheduled_task.done():
-            scheduled_task = asyncio.create_task(schedule_recurring_messages(base_timestamp))
-        else:
-            print("A scheduled task is already running.")
-
-sending_message = False
-
-@bot.command()
-async def starttimestamps(ctx, timestamp: str):
-    """Start recurring messages every 7 days from the given timestamp."""
-    await ctx.message.delete()
-
-    if ctx.author.id not in {286492096242909185}:  # Replace with your actual user ID
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-        return
-
-    try:
-        base_timestamp = datetime.datetime.fromisoformat(timestamp)
-        set_base_timestamp(base_timestamp)
-
-        await ctx.send(f"> Messages scheduled every 7 days from: ***{base_timestamp}***")
-
-        asyncio.create_task(schedule_recurring_messages(base_timestamp))  # Start scheduling
-    except ValueError:
-        await ctx.send("Invalid timestamp format. Use ISO format (YYYY-MM-DDTHH:MM:SS).", delete_after=3)
-
-@bot.command()
-async def stoptimestamps(ctx):
-    """Stop the recurring messages."""
-    await ctx.message.delete()
-
-    if ctx.author.id not in {286492096242909185}:
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+    # Most updates are nickname, avatar or timeout changes, so only a newly added watched role gets past this point
+    after_role_ids = member_role_ids(after)
+    added = after_role_ids - member_role_ids(before)
+    if not added:
         return
-    
-    set_base_timestamp(None)
-    await ctx.send("Messages stopped.")
-
-@bot.command()
-async def checktimestamps(ctx):
-    """Check the base timestamp for the recurring messages."""
-    await ctx.message.delete()
-
-    if ctx.author.id not in {286492096242909185}:
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+    role_ids = get_role_ids(after.guild)
+    if added.isdisjoint((role_ids['hr'], role_ids['pd'])):
         return
 
-    base_timestamp = get_base_timestamp()
-    await ctx.send(f"Base timestamp for recurring messages: {base_timestamp}")
-    next_timestamp = base_timestamp + datetime.timedelta(days=7)
-    await ctx.send(f"Next timestamp: {next_timestamp}")
-
-async def schedule_recurring_messages(base_timestamp=None):
-    """Schedules messages every 7 days from the base timestamp."""
-    if not base_timestamp:
-        base_timestamp = get_base_timestamp()  # Retrieve from DB
-
-    if not base_timestamp:
-        logging.warning("No valid base timestamp found. Use `/starttimestamps YYYY-MM-DDTHH:MM:SS` first.")
+    notifications = []
+    if role_ids['hr'] in added:
+        hr_role = after.guild.get_role(role_ids['hr'])
+        notifications.append(f"User {after.mention} received the {hr_role.mention} role.")
+    if role_ids['pd'] in added and role_ids['atributii'] and role_ids['atributii'] not in after_role_ids:
+        pd_role = after.guild.get_role(role_ids['pd'])
+        atributii_role = after.guild.get_role(role_ids['atributii'])
+        await after.add_roles(atributii_role)
+        notifications.append(f"User {after.mention} received the {pd_role.mention} and {atributii_role.mention} role.")
+    if not notifications:
         return
 
-    now = datetime.datetime.now()
-
-    # Find the next valid timestamp in the 7-day cycle
-    while base_timestamp < now:
-        base_timestamp += datetime.timedelta(days=7)
-
-    delay = (base_timestamp - now).total_seconds()
-    
-    logging.info(f"Next message scheduled in {delay} seconds ({base_timestamp})")
-    
-    await asyncio.sleep(delay)  # Wait until the next timestamp
-    await send_scheduled_message()  # Send the message
-
-    # Schedule the next message after 7 days
-    asyncio.create_task(schedule_recurring_messages(base_timestamp + datetime.timedelta(days=7)))
-
-async def send_scheduled_message():
-    """Send the scheduled message and log the event."""
-    channel = bot.get_channel(RENEW_CHANNEL_ID)
+    for notification in notifications:
+        logging.info(notification)
+    channel = configured_channel(after.guild, 'logs_channel')
     if channel:
-        role = discord.utils.get(channel.guild.roles, name=REQUIRED_HR_ROLE_NAME)
-        conducere = discord.utils.get(channel.guild.roles, name=LOGS_TAG_ROLE_NAME)
-
-        if role:
-            await channel.send(f"""||{role.mention}{conducere.mention}|| 
-                               **Please RENEW the BOT**
-                               > The next message will be sent in 7 days.
-                               > Also please restart the bot from the server.
-                               `This message was sent on {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`
-                               """)
-        else:
-            await channel.send("Please RENEW the BOT")
-
-def round_minutes(minutes):
-    """Round minutes according to the specified rules"""
-    return round(minutes / 5) * 5
-
-def is_allowed_channel(ctx):
-    """Check if the command is issued in the allowed channel"""
-    return ctx.channel.id == ALLOWED_CHANNEL_ID
-
-def is_allowed_admin_channel(ctx):
-    """Check if the command is issued in the allowed admin channel"""
-    return ctx.channel.id == ALLOWED_ADMIN_CHANNEL_ID
-
-def is_allowed_punish_channel(ctx):
-    """Check if the command is issued in the allowed admin channel"""
-    return ctx.channel.id == ALLOWED_PUNISH_CHANNEL_ID
-
-# this one is for the pd role check
-def has_required_pd_role(ctx):
-    """Check if the user has the required role"""
-    role = discord.utils.get(ctx.guild.roles, name=REQUIRED_PD_ROLE_NAME)
-    return role in ctx.author.roles
-
-# check hr role
-def has_required_hr_role(ctx):
-    """Check if the user has the required role"""
-    role = discord.utils.get(ctx.guild.roles, name=REQUIRED_HR_ROLE_NAME)
-    return role in ctx.author.roles
-
-# check asp+ role for ongoing
-def has_required_specific_role(ctx):
-    user_roles = [role.name for role in ctx.author.roles]
-    return any(role in user_roles for role in REQUIRED_PD_SPECIFIC_ROLE_NAME)
-
-def has_required_conducere_role(ctx):
-    """Check if the user has the required role"""
-    role = discord.utils.get(ctx.guild.roles, name=LOGS_TAG_ROLE_NAME)
-    return role in ctx.author.roles
-
-@bot.command()
-@cooldown(1,1.5,BucketType.default)
-async def clockin(ctx):
-    """Store the clock-in time for a user"""
-    await ctx.message.delete()
-    if not is_allowed_channel(ctx):
-        allowed_channel = ctx.guild.get_channel(ALLOWED_CHANNEL_ID)
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-        await ctx.send(f"{ctx.author.mention}, you can only use this command in {allowed_channel.mention}.", delete_after=3)
-        return
-    
-    if not has_required_pd_role(ctx):
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-        return
-
-    user_id = ctx.author.id
-    current_time = datetime.datetime.now()
-    date_str = current_time.strftime("%Y-%m-%d")
-
-    sessions = get_clock_times(user_id, date_str)
-    for session in sessions:
-        if session[1] is None:
-            await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-            await ctx.send(f"{ctx.author.mention}, you already have an active clock-in. Please clock out first.", delete_after=3)
-            role = discord.utils.get(ctx.guild.roles, name=LOGS_TAG_ROLE_NAME)
-            hr = discord.utils.get(ctx.guild.roles, name=REQUIRED_HR_ROLE_NAME)
-            logging.warning(f"{role.mention} {hr.mention}")
-            logging.warning(f"User {ctx.author.mention} tried to clock in with an active session. Session started at: {session[0]}")
-            return
-
-    add_clock_in(user_id, date_str, current_time.strftime("%H:%M:%S"))
-    await ctx.send(f"```--------------------------------------------------------```")
-    await ctx.send(f"{ctx.author.mention} clocked in at {current_time.strftime('%H:%M:%S')} on {date_str}")
-    logging.info(f"User {ctx.author} clocked in at {current_time.strftime('%H:%M:%S')} on {date_str}.")
-
-@bot.command()
-@cooldown(1,1.5,BucketType.default)
-async def clockout(ctx):
-    """Calculate the time difference between clock-in and clock-out"""
-    await ctx.message.delete()
-    if not is_allowed_channel(ctx):
-        allowed_channel = ctx.guild.get_channel(ALLOWED_CHANNEL_ID)
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-        await ctx.send(f"{ctx.author.mention}, you can only use this command in {allowed_channel.mention}.", delete_after=3)
-        return
-
-    if not has_required_pd_role(ctx):
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-        return
-    
-    user_id = ctx.author.id
-    current_time = datetime.datetime.now()
-    date_str = current_time.strftime("%Y-%m-%d")
-
-    sessions = get_clock_times(user_id, date_str)
-    for session in sessions:
-        if session[1] is None:
-            update_clock_out(user_id, date_str, current_time.strftime("%H:%M:%S"))
-            clock_in_time_str = f"{date_str} {session[0]}"
-            clock_in_time = datetime.datetime.strptime(clock_in_time_str, "%Y-%m-%d %H:%M:%S")
-            time_diff = current_time - clock_in_time
-            minutes = time_diff.total_seconds() / 60
-            rounded_minutes = round_minutes(minutes)
-            await ctx.send(f"```--------------------------------------------------------```")
-            await ctx.send(f"{ctx.author.mention} clocked out at {current_time.strftime('%H:%M:%S')} on {date_str}. Total time: {rounded_minutes:.2f} minutes")
-            logging.info(f"User {ctx.author} clocked out at {current_time.strftime('%H:%M:%S')} on {date_str}. Total time: {rounded_minutes:.2f} minutes.")
-            return
-
-    await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-    await ctx.send(f"{ctx.author.mention}, you need to clock in first using `/clockin`.", delete_after=3)
-
-@bot.command()
-async def worked(ctx, date: str = None, user: discord.Member = None):
-    """Show total worked time for all users or a specific user on a specific date (default: today)"""
-    await ctx.message.delete()
-    if not is_allowed_admin_channel(ctx):
-        allowed_channel = ctx.guild.get_channel(ALLOWED_ADMIN_CHANNEL_ID)
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-        await ctx.send(f"{ctx.author.mention}, you can only use this command in {allowed_channel.mention}.", delete_after=3)
-        return
-
-    if not (has_required_hr_role(ctx) or has_required_conducere_role(ctx)):
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-        return
-
-    if date is None:
-        # date = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")  
-        date = datetime.datetime.now().strftime("%Y-%m-%d")  
-        
-    report = []
-
-    if user:
-        user_id = user.id
-        sessions = get_clock_times(user_id, date)
-        total_minutes = 0
-        details = []
-        for idx, session in enumerate(sessions, start=1):
-            if session[0] and session[1]:
-                clock_in_time = datetime.datetime.strptime(session[0], "%H:%M:%S")
-                clock_out_time = datetime.datetime.strptime(session[1], "%H:%M:%S")
-                minutes = (clock_out_time - clock_in_time).total_seconds() / 60
-                rounded_minutes = round_minutes(minutes)
-                total_minutes += rounded_minutes
-                if(rounded_minutes > 0):
-                    details.append(f"{idx}. {session[0]} - {session[1]} ({rounded_minutes:.2f} min)")
-
-        if total_minutes > 0:
-            details_text = "\n".join(details)
-            report.append(f"**{user.mention}** - Total: ({total_minutes:.2f}) minutes\n{details_text}")
-        else:
-            report.append(f"No work sessions found for {user.mention} on {date}.")
-    else:
-        async for member in ctx.guild.fetch_members(limit=None):
-            user_id = member.id
-            sessions = get_clock_times(user_id, date)
-            total_minutes = 0
-            details = []
-            for idx, session in enumerate(sessions, start=1):
-                if session[0] and session[1]:
-                    clock_in_time = datetime.datetime.strptime(session[0], "%H:%M:%S")
-                    clock_out_time = datetime.datetime.strptime(session[1], "%H:%M:%S")
-                    minutes = (clock_out_time - clock_in_time).total_seconds() / 60
-                    rounded_minutes = round_minutes(minutes)
-                    total_minutes += rounded_minutes
-
-            if total_minutes > 0:
-                details_text = "\n".join(details)
-                report.append(f"**{member.mention}** - Total: ({total_minutes:.2f}) minutes\n{details_text}")
-
-    if report:
-        report_text = "\n\n".join(report)
-        await ctx.send(f"```--------------------------------------------------------```")
-        await ctx.send(f"**Worked time report for {date}:**\n\n{report_text}")
-        logging.info(f"User {ctx.author} requested worked time report for {date}.")
-    else:
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-        await ctx.send(f"No records found for {date}.", delete_after=3)
-        logging.info(f"User {ctx.author} requested worked time report for {date}, but no records were found.")
-
-@bot.command()
-async def rmv(ctx, user: discord.Member, date: str, index: int):
-    """Remove a specific clock-in/out session for a user on a specific date by index"""
-    await ctx.message.delete()
-    if not is_allowed_admin_channel(ctx):
-        allowed_channel = ctx.guild.get_channel(ALLOWED_ADMIN_CHANNEL_ID)
-        await ctx.send(f"{ctx.author.mention}, you can only use this command in {allowed_channel.mention}.", delete_after=3)
-        return
+        role = get_role(after.guild, 'conducere')
+        tag = f"|| {role.mention} || " if role else ""
+        await channel.send(tag + "\n".join(notifications))
 
-    if not has_required_hr_role(ctx):
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-        return
+@bot.event
+async def on_ready():
+    print(f"Logged in as {bot.user}")
+    if not bot.legacy_claimed:
+        bot.legacy_claimed = True
+        await bot.claim_legacy_rows()
 
-    user_id = user.id
-    sessions = get_clock_times(user_id, date)
-    
-    if index < 1 or index > len(sessions):
-        await ctx.send(f"{ctx.author.mention}, invalid index. Please provide a valid session index.", delete_after=3)
-        return
+@bot.event
+async def on_guild_role_create(role):
+    refresh_role_ids(role.guild)
 
-    # Get the session based on the provided index (1-based index)
-    session_to_remove = sessions[index - 1]
-    clock_in_time = session_to_remove[0]
+@bot.event
+async def on_guild_role_update(before, after):
+    refresh_role_ids(after.guild)
 
-    remove_session(user_id, date, clock_in_time)
-    await ctx.send(f"{ctx.author.mention}, removed session for {user.mention} on {date} at index {index}. Session: {session_to_remove}")
-    await user.send(f"Your session {session_to_remove} on {date} was removed by {ctx.author.mention}.")
-    logging.warning(f"Command: /rmv, User: {ctx.author.mention}, Target: {user.mention}, Date: {date}, Index: {index}, Session: {session_to_remove}")
-    logging.info(f"User {ctx.author.mention} removed session for {user.mention} on {date} at index {index}. Session: {session_to_remove}")
+@bot.event
+async def on_guild_role_delete(role):
+    refresh_role_ids(role.guild)
 
 @bot.command()
-async def ongoing(ctx, user: discord.Member = None, action: str = None):
-    """Show ongoing work sessions for all users or stop a specific user's ongoing session"""
+async def reload(ctx, name: str = None):
+    """Reload one command module, or every loaded one, without reconnecting"""
     await ctx.message.delete()
-    if not is_allowed_channel(ctx):
-        allowed_channel = ctx.guild.get_channel(ALLOWED_CHANNEL_ID)
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-        await ctx.send(f"{ctx.author.display_name}, you can only use this command in {allowed_channel.mention}.", delete_after=3)
-        return
 
-    if not (has_required_hr_role(ctx) or has_required_specific_role(ctx)):
-        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
+    if not is_bot_owner(ctx):
         await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
         return
 
-    report = []
-    current_time = datetime.datetime.now()
-
-    if user:
-        user_id = user.id
-        sessions = get_clock_times(user_id, current_time.strftime("%Y-%m-%d"))
-        for session in sessions:
-            if session[1] is None:
-                if action == "stop":
-                    if (has_required_hr_role(ctx) or has_required_conducere_role(ctx)):
-                        remove_session(user_id, current_time.strftime("%Y-%m-%d"), session[0])
-                        await ctx.send(f"```--------------------------------------------------------```")
-                        await ctx.send(f"{ctx.author.mention}, stopped and removed clock-in for {user.mention} at {session[0]}.")
-                        await user.send(f"Your clock-in on {session[0]} was stopped by {ctx.author.mention}.")
-                        logging.info(f"Command: /ongoing stop, User: {ctx.author}, Target: {user}, Session started at: {session[0]}")
-                        logging.warning(f"User {ctx.author.mention} stopped and removed clock-in for {user.mention} at {session[0]}.")
-                        return
-                    else:
-                        await ctx.send(f"```--------------------------------------------------------```", delete_after=3)
-                        await ctx.send(f"{ctx.author.mention}, you do not have permission to stop ongoing sessions.", delete_after=3)
-                        return
-                else:
-                    report.append(f"**{user.mention}** - Clocked in at {session[0]}")
-    else:
-        ongoing_sessions = get_ongoing_sessions()
-        for user_id, date, clock_in in ongoing_sessions:
-            member = ctx.guild.get_member(user_id)
-            if member is None:
-                member = await bot.fetch_user(user_id)
-                if member:
-                    report.append(f"**{member.mention}** - Clocked in at {clock_in}")
+    extensions = [f"cogs.{name}"] if name else list(bot.extensions)
+    lines = []
+    for extension in extensions:
+        try:
+            if extension in bot.extensions:
+                await bot.reload_extension(extension)
             else:
-                report.append(f"**{member.mention}** - Clocked in at {clock_in}")
-
-    if report:
-        await ctx.send(f"```--------------------------------------------------------```")
-        await ctx.send("Ongoing work sessions:\n\n" + "\n".join(report))
-    else:
-        await ctx.send("No ongoing work sessions found.", delete_after=3)
-
-@bot.command()
-async def addminutes(ctx, user: discord.Member, date: str, minutes: float):
-    """Add minutes to the last clock-in session for a user on a specific date or create a new session if none exists"""
-    await ctx.message.delete()
-    if not is_allowed_admin_channel(ctx):
-        allowed_channel = ctx.guild.get_channel(ALLOWED_ADMIN_CHANNEL_ID)
-        await ctx.send(f"{ctx.author.mention}, you can only use this command in {allowed_channel.mention}.", delete_after=3)
-        return
-
-    if not has_required_hr_role(ctx):
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-        return
-
-    user_id = user.id
-    sessions = get_clock_times(user_id, date)
-    
-    if sessions:
-        last_session = sessions[-1]
-        if last_session[1] is None:
-            clock_in_time_str = f"{date} {last_session[0]}"
-            clock_in_time = datetime.datetime.strptime(clock_in_time_str, "%Y-%m-%d %H:%M:%S")
-            new_clock_out_time = clock_in_time + datetime.timedelta(minutes=minutes)
-            update_clock_out(user_id, date, new_clock_out_time.strftime("%H:%M:%S"))
-            await ctx.send(f"{ctx.author.mention}, added {minutes:.2f} minutes to {user.mention}'s last session. New clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}", delete_after=3)
-            await user.send(f"Your last session on {date} was extended by {minutes:.2f} minutes by {ctx.author.mention}. New clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}. Next time, please use `/clockin` and `/clockout` to avoid this.")
-            logging.warning(f"User {ctx.author.mention} added {minutes:.2f} minutes to {user.mention}'s last session. New clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.")
-            logging.info(f"User {ctx.author.mention} added {minutes:.2f} minutes to {user.mention}'s last session. New clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.")
-        else:
-            clock_in_time = datetime.datetime.strptime(f"{date} 00:00:00", "%Y-%m-%d %H:%M:%S")
-            new_clock_out_time = clock_in_time + datetime.timedelta(minutes=minutes)
-            add_clock_in(user_id, date, clock_in_time.strftime("%H:%M:%S"))
-            update_clock_out(user_id, date, new_clock_out_time.strftime("%H:%M:%S"))
-            await ctx.send(f"{ctx.author.mention}, created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}", delete_after=3)
-            await user.send(f"Your new session on {date} was created with {minutes:.2f} minutes by {ctx.author.mention}. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}. Next time, please use `/clockin` and  `/clockout` to avoid this.")
-            logging.warning(f"User {ctx.author.mention} created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.")
-            logging.info(f"User {ctx.author.mention} created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.")
-    else:
-        clock_in_time = datetime.datetime.strptime(f"{date} 00:00:00", "%Y-%m-%d %H:%M:%S")
-        new_clock_out_time = clock_in_time + datetime.timedelta(minutes=minutes)
-        add_clock_in(user_id, date, clock_in_time.strftime("%H:%M:%S"))
-        update_clock_out(user_id, date, new_clock_out_time.strftime("%H:%M:%S"))
-        await ctx.send(f"{ctx.author.mention}, created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}", delete_after=3)
-        await user.send(f"Your new session on {date} was created with {minutes:.2f} minutes by {ctx.author.mention}. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}. Next time, please use `/clockin` and  `/clockout` to avoid this.")
-        logging.warning(f"User {ctx.author.mention} created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.")
-        logging.info(f"User {ctx.author.mention} created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.")
-    
-@bot.command()
-async def helpme(ctx, action: str = None):
-    """Show the list of available commands"""
-    await ctx.message.delete()
-    if ctx.author.id != 286492096242909185:  # Replace YOUR_USER_ID with the actual user ID
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-        return
-
-    if action == "pontaje":
-        help_text = """
-        **Available commands:**
-        > `/clockin`: Starts the work session
-        > `/clockout`: Calculate the time difference between clock-in and clock-out
-        """
-    elif action == "hr":
-        help_text = """
-        **Available commands:**
-        > `/worked [date] [user]`: Show total worked time for all users or a specific user on a specific date (default: today)
-        > `/rmv [user] [date] [index]`: Remove a specific clock-in/out session for a user on a specific date by index (ONLY USE THIS IF YOU NOTICE SOMEONE THAT LEFT HIS CLOCK IN OPENED AND CLOSED IT EVEN THO THEY WERE NOT ONLINE)
-        > `/ongoing [user] [action]`: Show ongoing work sessions for all users or stop a specific user's ongoing session
-        > `/addminutes [user] [date] [minutes]`: Add minutes to the last clock-in session for a user on a specific date or create a new session if none exists (IF YOU ABUSE THIS COMMAND YOU WILL BE DEMITTED)
-        > `/warn [user] [message]`: Warns a user with a warning message ( Gives a warning to the user. ALWAYS PUNISH AFTER REMOVING THE SESSION OR STOPPING THE SESSION)
-        > *For the last command, if the message is `reset`, the command will reset the warns count for the user and if the message is `?` the command will show the current warns count for the user*
-        > Only CONDUCERE has access to reset. Please use `reset [message]` to reset the warns count for a user and also provide the message.
-        > ***When typing the date parameter, use the format YYYY-MM-DD***
-        """
-    elif action == "admin":
-        help_text = """
-        **Available commands:**
-        > `/starttimestamps`: Starts recurring messages every 7 days from the given timestamp. Timestemap format: YYYY-MM-DDTHH:MM:SS
-        > `/stoptimestamps`: Stops the recurring messages
-        > `/checktimestamps`: Check the base timestamp for the recurring messages
-        """
-    await ctx.send(help_text)
+                await bot.load_extension(extension)
+            lines.append(f"> `{extension}` reloaded")
+        except commands.ExtensionError as error:
+            # A module that fails to reload keeps running its previous version
+            lines.append(f"> `{extension}` failed: {error}")
+            logging.exception(f"Could not reload {extension}.")
+    await ctx.send("\n".join(lines) or "No command modules are loaded.")
+    logging.info(f"User {ctx.author} reloaded {', '.join(extensions)}.")
 
 @bot.command()
-async def warn(ctx, user: discord.Member,*, message: str = None):
+async def sync(ctx, scope: str = None):
+    """Publish the slash commands to this server, to every server with `global`, or remove them from this server with `clear`"""
     await ctx.message.delete()
 
-    if not message:
-        await ctx.send(f"{ctx.author.mention}, please provide a message for the warning.", delete_after=3)
-        return
-
-    if not (has_required_hr_role(ctx) or has_required_conducere_role(ctx)):
+    if not is_bot_owner(ctx):
         await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
         return
 
-    if not is_allowed_punish_channel(ctx):
-        allowed_channel = ctx.guild.get_channel(ALLOWED_PUNISH_CHANNEL_ID)
-        await ctx.send(f"{ctx.author.mention}, you can only use this command in {allowed_channel.mention}.", delete_after=3)
-        return
-
-    user_id = user.id
-
-    if message.startswith("reset"):
-        if not has_required_conducere_role(ctx):
-            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-            return
-        reset_punish_count(user_id)
-        reset_message = message[5:]
-        afterreset = get_punish_count(user_id)
-        await ctx.send(f"""{ctx.author.mention} has reset the warns count for {user.mention}.
-                       > {user.mention} now has ***{afterreset} / 5 warnings***.
-                       ```{reset_message if reset_message else ''}```""")
-        await user.send(f"""Your warns count has been reset by {ctx.author.mention}. 
-                        > You now have ***{afterreset} / 5 warnings***.
-                        ```{reset_message if reset_message else ''}```""")
-        logging.info(f"User {ctx.author.mention} reset the warns count for {user.mention}. ")
-        logging.warning(f"User {ctx.author.mention} reset the warns count for {user.mention}.")
-        return
-    elif message.startswith("?"):
-        current_count = get_punish_count(user_id)
-        await ctx.send(f"> {user.mention} has ***{current_count} warnings***.")
-        return
-
-    current_count = get_punish_count(user_id)
-
-    if current_count >= 5:
-        await ctx.send(f"{ctx.author.mention}, {user.mention} has already reached the maximum number of warns.", delete_after=3)
-        return
-
-    new_count = increment_punish_count(user_id)
-    conducere = discord.utils.get(ctx.guild.roles, name=LOGS_TAG_ROLE_NAME)
-    hr = discord.utils.get(ctx.guild.roles, name=REQUIRED_HR_ROLE_NAME)
-    if(new_count == 5):
-        punish_text=f"""
-        ### {user.mention} got a warning from {ctx.author.mention}.
-        > This is warning number ***{new_count} / 5***.
-        ||{conducere.mention}{hr.mention}||
-        ```{message if message else ''}```
-        """
+    if scope == "global":
+        synced = await bot.tree.sync()
+    elif scope == "clear":
+        bot.tree.clear_commands(guild=ctx.guild)
+        synced = await bot.tree.sync(guild=ctx.guild)
     else:
-        punish_text=f"""
-        ### {user.mention} got a warning from {ctx.author.mention}.
-        > This is warning number ***{new_count} / 5***.
-        ```{message if message else ''}```
-        """
-    await ctx.send(punish_text)
-    await user.send("You have been given a warning by the HR team. Check the discord server for more information.")
-
-    logging.info(punish_text)
-    logging.warning(punish_text)
-
-@bot.command()
-async def say(ctx, *, message: str):
-    """Send a message to a specific channel"""
-    await ctx.message.delete()
-
-    if ctx.author.id not in {286492096242909185}:  # Replace with your actual user ID
-        await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
-        return
-    
-    await ctx.send(message)
+        bot.tree.copy_global_to(guild=ctx.guild)
+        synced = await bot.tree.sync(guild=ctx.guild)
+    await ctx.send(f"> Synced {len(synced)} slash commands{' globally' if scope == 'global' else ''}.")
+    logging.info(f"User {ctx.author} synced the slash commands ({scope or 'guild'}).")
 
 # Run the bot with your token
-bot.run(TOKEN)
\ No newline at end of file
+if __name__ == '__main__':
+    bot.run(TOKEN)
+    shutdown_db()
+    log_listener.stop()
@@ -0,0 +1,166 @@
+import logging
+from discord.ext import commands
+import metrics
+from database import connection_counts
+from async_database import rebuild_daily_totals
+from common import GUILD_SETTINGS, parse_id, get_config, set_config, is_owner, is_bot_owner, send_report
+
+def format_latency(histogram):
+    return (f"{histogram.count} calls, avg {histogram.sum / histogram.count * 1000:.1f} ms, "
+            f"p50 <= {histogram.quantile(0.5) * 1000:g} ms, p95 <= {histogram.quantile(0.95) * 1000:g} ms")
+
+def format_setting(value):
+    if value is None:
+        return "not set"
+    if isinstance(value, (list, frozenset)):
+        return ", ".join(str(item) for item in value)
+    return str(value)
+
+class Admin(commands.Cog):
+    """Owner tools"""
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command()
+    async def helpme(self, ctx, action: str = None):
+        """Show the list of available commands"""
+        await ctx.message.delete()
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        if action == "pontaje":
+            help_text = """
+        **Available commands:**
+        > `/clockin`: Starts the work session
+        > `/clockout`: Calculate the time difference between clock-in and clock-out
+        """
+        elif action == "hr":
+            help_text = """
+        **Available commands:**
+        > `/worked [date] [user]`: Show total worked time for all users or a specific user on a specific date (default: today)
+        > *Instead of a date you can use `week`, `month`, a month as `YYYY-MM` or a period as `YYYY-MM-DD:YYYY-MM-DD`*
+        > `/top [period] [count] [top|bottom]`: Rank users by worked time over a date or period (default: the 10 users with the most time this week). Use `bottom` to list the least time first
+        > `/export [date] [format]`: Upload every session of a date or period as a `csv` (default) or `jsonl` file
+        > `/rmv [user] [date] [index]`: Remove a specific clock-in/out session for a user on a specific date by index (ONLY USE THIS IF YOU NOTICE SOMEONE THAT LEFT HIS CLOCK IN OPENED AND CLOSED IT EVEN THO THEY WERE NOT ONLINE)
+        > `/ongoing [user] [action]`: Show ongoing work sessions for all users or stop a specific user's ongoing session
+        > `/addminutes [user] [date] [minutes]`: Add minutes to the last clock-in session for a user on a specific date or create a new session if none exists (IF YOU ABUSE THIS COMMAND YOU WILL BE DEMITTED)
+        > `/warn [user] [message]`: Warns a user with a warning message ( Gives a warning to the user. ALWAYS PUNISH AFTER REMOVING THE SESSION OR STOPPING THE SESSION)
+        > *For the last command, if the message is `reset`, the command will reset the warns count for the user, if the message is `?` the command will show the current warns count for the user and if the message is `history` the command will show the user's latest warnings*
+        > Only CONDUCERE has access to reset. Please use `reset [message]` to reset the warns count for a user and also provide the message.
+        > ***When typing the date parameter, use the format YYYY-MM-DD***
+        """
+        elif action == "admin":
+            help_text = """
+        **Available commands:**
+        > `/starttimestamps`: Starts recurring messages every 7 days from the given timestamp. Timestemap format: YYYY-MM-DDTHH:MM:SS
+        > `/stoptimestamps`: Stops the recurring messages
+        > `/checktimestamps`: Check the base timestamp for the recurring messages
+        > `/jobs`: List the scheduled jobs
+        > `/schedulejob [kind] [first_run] [interval_hours]`: Schedule a `renew_reminder`, `stale_session_sweep`, `daily_report`, `archive_sessions` or `backup_database` job. First run format: YYYY-MM-DDTHH:MM:SS, the interval is at least 1 hour
+        > `/archive [run]`: Show the archived months, or move finished sessions older than the retention period to the archive now (this also runs every `ARCHIVE_INTERVAL_HOURS`, 24 by default)
+        > `/backup [run|restore] [name]`: List the database snapshots, take one now, or restore one by name (the current data is saved first). A snapshot is also taken every `BACKUP_INTERVAL_HOURS`, 24 by default
+        > `/canceljob [id]`: Cancel a scheduled job
+        > `/config [setting] [value|reset]`: Show this server's settings, or change one. Channels and owners take mentions or IDs, roles take names (several specific roles separated by commas). Use `reset` to go back to the default
+        > `/throttled`: Show how many requests were rejected by a cooldown
+        > `/stats`: Show command latency, storage timings, connection and API call counts
+        > `/reload [module]`: Reload a command module (`clocking`, `hr`, `punishments`, `scheduling`, `admin`) or all of them without restarting the bot
+        > `/rebuildtotals`: Recompute the daily totals used by period reports
+        """
+        await ctx.send(help_text)
+
+    @commands.command()
+    async def rebuildtotals(self, ctx):
+        """Recompute the daily totals used by period reports from the stored sessions"""
+        await ctx.message.delete()
+
+        if not is_bot_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        await rebuild_daily_totals()
+        await ctx.send("Daily totals rebuilt.")
+        logging.info(f"User {ctx.author} rebuilt the daily totals.")
+
+    @commands.command()
+    async def throttled(self, ctx):
+        """Show how many requests were rejected by a cooldown"""
+        await ctx.message.delete()
+
+        if not is_bot_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        if not metrics.cooldown_rejections:
+            await ctx.send("No requests have been throttled.")
+            return
+        lines = [f"> `/{name}`: {count}" for name, count in metrics.cooldown_rejections.most_common()]
+        await ctx.send(f"**Throttled requests:** {sum(metrics.cooldown_rejections.values())}\n" + "\n".join(lines))
+
+    @commands.command()
+    async def stats(self, ctx):
+        """Show command latency, storage timings, connection and API call counts"""
+        await ctx.message.delete()
+
+        if not is_bot_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        open_connections, opened_connections = connection_counts()
+        lines = ["**Commands:**"]
+        for name, histogram in sorted(metrics.command_latency.items()):
+            lines.append(f"> `/{name}`: {format_latency(histogram)}, {metrics.api_calls[name]} API calls, "
+                         f"{metrics.cooldown_rejections[name]} throttled")
+        lines.append("**Storage:**")
+        for name, histogram in sorted(metrics.query_latency.items()):
+            lines.append(f"> `{name}`: {format_latency(histogram)}")
+        lines.append(f"**Connections:** {open_connections} open, {opened_connections} opened since startup")
+        lines.append(f"**API calls outside commands:** {metrics.api_calls[None]}")
+        lines.append(f"**Shards:** {len(self.bot.guilds)} guilds, " +
+                     ", ".join(f"shard {shard_id} {latency * 1000:.0f} ms" for shard_id, latency in self.bot.latencies))
+        await send_report(ctx, "**Bot statistics:**", lines)
+
+    @commands.command()
+    async def say(self, ctx, *, message: str):
+        """Send a message to a specific channel"""
+        await ctx.message.delete()
+
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        await ctx.send(message)
+
+    @commands.command()
+    async def config(self, ctx, setting: str = None, *, value: str = None):
+        """Show this server's settings, change one, or reset it to the default with `reset`"""
+        await ctx.message.delete()
+
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        if setting is not None and setting not in GUILD_SETTINGS:
+            await ctx.send(f"Unknown setting. Use one of: {', '.join(GUILD_SETTINGS)}.", delete_after=3)
+            return
+
+        if value is not None:
+            try:
+                if value != "reset" and setting.endswith('_channel') and ctx.guild.get_channel(parse_id(value)) is None:
+                    await ctx.send("That channel is not in this server.", delete_after=3)
+                    return
+                await set_config(ctx.guild.id, setting, None if value == "reset" else value)
+            except ValueError:
+                await ctx.send(f"Invalid value for `{setting}`.", delete_after=3)
+                return
+            logging.info(f"User {ctx.author} set {setting} to {value} in guild {ctx.guild.id}.")
+
+        config = get_config(ctx.guild.id)
+        lines = []
+        for name in ([setting] if setting else GUILD_SETTINGS):
+            source = "" if name in config.stored else " *(default)*"
+            lines.append(f"> `{name}`: {format_setting(getattr(config, name))}{source}")
+        await send_report(ctx, f"**Settings for {ctx.guild.name}:**", lines)
+
+async def setup(bot):
+    await bot.add_cog(Admin(bot))
@@ -0,0 +1,75 @@
+import datetime
+import logging
+from discord.ext import commands
+from discord.ext.commands import cooldown, max_concurrency, BucketType
+from database import round_minutes, to_timestamp
+from async_database import add_clock_in, update_clock_out
+from common import (SEPARATOR, CLOCK_CONCURRENCY, is_allowed_channel, has_required_pd_role, role_mentions, channel_requirement,
+                    format_time, delete_invocation, send_temporary)
+
+class Clocking(commands.Cog):
+    """PD members clocking in and out"""
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.hybrid_command()
+    @cooldown(1,1.5,BucketType.user)
+    @max_concurrency(CLOCK_CONCURRENCY, BucketType.default, wait=True)
+    async def clockin(self, ctx):
+        """Store the clock-in time for a user"""
+        await delete_invocation(ctx)
+        if not is_allowed_channel(ctx):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, {channel_requirement(ctx.guild, 'clock_channel')}")
+            return
+
+        if not has_required_pd_role(ctx):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, you do not have permission to use this command.")
+            return
+
+        user_id = ctx.author.id
+        current_time = datetime.datetime.now()
+        date_str = current_time.strftime("%Y-%m-%d")
+
+        started, start_ts = await add_clock_in(ctx.guild.id, user_id, current_time)
+        if not started:
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, you already have an active clock-in. Please clock out first.")
+            tags = role_mentions(ctx.guild, 'conducere', 'hr')
+            if tags:
+                logging.warning(tags)
+            logging.warning(f"User {ctx.author.mention} tried to clock in with an active session. Session started at: {format_time(start_ts)}")
+            return
+
+        await ctx.send(f"{SEPARATOR}\n{ctx.author.mention} clocked in at {current_time.strftime('%H:%M:%S')} on {date_str}")
+        logging.info(f"User {ctx.author} clocked in at {current_time.strftime('%H:%M:%S')} on {date_str}.", extra={'user_id': user_id, 'date': date_str})
+
+    @commands.hybrid_command()
+    @cooldown(1,1.5,BucketType.user)
+    @max_concurrency(CLOCK_CONCURRENCY, BucketType.default, wait=True)
+    async def clockout(self, ctx):
+        """Calculate the time difference between clock-in and clock-out"""
+        await delete_invocation(ctx)
+        if not is_allowed_channel(ctx):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, {channel_requirement(ctx.guild, 'clock_channel')}")
+            return
+
+        if not has_required_pd_role(ctx):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, you do not have permission to use this command.")
+            return
+
+        user_id = ctx.author.id
+        current_time = datetime.datetime.now()
+        date_str = current_time.strftime("%Y-%m-%d")
+
+        start_ts = await update_clock_out(ctx.guild.id, user_id, current_time)
+        if start_ts is not None:
+            minutes = (to_timestamp(current_time) - start_ts) / 60
+            rounded_minutes = round_minutes(minutes)
+            await ctx.send(f"{SEPARATOR}\n{ctx.author.mention} clocked out at {current_time.strftime('%H:%M:%S')} on {date_str}. Total time: {rounded_minutes:.2f} minutes")
+            logging.info(f"User {ctx.author} clocked out at {current_time.strftime('%H:%M:%S')} on {date_str}. Total time: {rounded_minutes:.2f} minutes.",
+                         extra={'user_id': user_id, 'date': date_str, 'duration': rounded_minutes})
+            return
+
+        await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, you need to clock in first using `/clockin`.")
+
+async def setup(bot):
+    await bot.add_cog(Clocking(bot))
@@ -0,0 +1,265 @@
+import datetime
+import logging
+import os
+import discord
+from discord.ext import commands
+from export import EXPORT_FORMATS
+from async_database import (add_session, update_clock_out, get_clock_times, get_worked_report, get_range_report,
+                            get_leaderboard, get_ongoing_sessions, export_timesheet, remove_session)
+from common import (SEPARATOR, is_allowed_channel, is_allowed_admin_channel, has_required_hr_role, has_required_specific_role,
+                    has_required_conducere_role, channel_requirement, parse_date_range, format_time, send_report,
+                    delete_invocation, send_temporary, send_temporary_after_defer)
+
+MAX_LEADERBOARD_SIZE = 50
+
+class HR(commands.Cog):
+    """Worked time reports and session corrections for HR"""
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.hybrid_command()
+    async def worked(self, ctx, date: str = None, user: discord.Member = None):
+        """Show total worked time for all users or a specific user on a date or over a period (default: today)"""
+        await delete_invocation(ctx)
+        if not is_allowed_admin_channel(ctx):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, {channel_requirement(ctx.guild, 'admin_channel')}")
+            return
+
+        if not (has_required_hr_role(ctx) or has_required_conducere_role(ctx)):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, you do not have permission to use this command.")
+            return
+
+        if date is None:
+            # date = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")  
+            date = datetime.datetime.now().strftime("%Y-%m-%d")  
+
+        try:
+            date_range = parse_date_range(date)
+        except ValueError:
+            await send_temporary(ctx, f"{SEPARATOR}\nInvalid date. Use YYYY-MM-DD, YYYY-MM, week, month or YYYY-MM-DD:YYYY-MM-DD.")
+            return
+
+        # Reports can take a while, so acknowledge slash commands before querying
+        await ctx.defer()
+        report = []
+        if date_range:
+            start_date, end_date = date_range
+            date = f"{start_date} - {end_date}"
+            for user_id, total_minutes, days in await get_range_report(ctx.guild.id, start_date, end_date, user.id if user else None):
+                if total_minutes > 0:
+                    mention = user.mention if user else self.bot.user_resolver.mention(ctx.guild, user_id)
+                    details_text = "\n".join(f"{day}: {minutes:.2f} min" for day, minutes in days if minutes > 0) if user else ""
+                    report.append(f"**{mention}** - Total: ({total_minutes:.2f}) minutes\n{details_text}")
+            if user and not report:
+                report.append(f"No work sessions found for {user.mention} between {start_date} and {end_date}.")
+        elif user:
+            for _, total_minutes, sessions in await get_worked_report(ctx.guild.id, date, user.id):
+                details = [f"{idx}. {format_time(start_ts)} - {format_time(end_ts)} ({rounded_minutes:.2f} min)"
+                           for idx, start_ts, end_ts, rounded_minutes in sessions if rounded_minutes > 0]
+                if total_minutes > 0:
+                    details_text = "\n".join(details)
+                    report.append(f"**{user.mention}** - Total: ({total_minutes:.2f}) minutes\n{details_text}")
+            if not report:
+                report.append(f"No work sessions found for {user.mention} on {date}.")
+        else:
+            for user_id, total_minutes, sessions in await get_worked_report(ctx.guild.id, date):
+                if total_minutes > 0:
+                    mention = self.bot.user_resolver.mention(ctx.guild, user_id)
+                    report.append(f"**{mention}** - Total: ({total_minutes:.2f}) minutes\n")
+
+        if report:
+            await send_report(ctx, f"**Worked time report for {date}:**", report, separator="\n\n")
+            logging.info(f"User {ctx.author} requested worked time report for {date}.", extra={'user_id': ctx.author.id, 'date': date})
+        else:
+            await send_temporary_after_defer(ctx, f"{SEPARATOR}\nNo records found for {date}.")
+            logging.info(f"User {ctx.author} requested worked time report for {date}, but no records were found.")
+
+    @commands.hybrid_command()
+    async def top(self, ctx, period: str = "week", count: int = 10, order: str = "top"):
+        """Rank users by worked time over a date or period, least first with `bottom` (default: this week)"""
+        await delete_invocation(ctx)
+        if not is_allowed_admin_channel(ctx):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, {channel_requirement(ctx.guild, 'admin_channel')}")
+            return
+
+        if not (has_required_hr_role(ctx) or has_required_conducere_role(ctx)):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, you do not have permission to use this command.")
+            return
+
+        if order not in ("top", "bottom") or not 1 <= count <= MAX_LEADERBOARD_SIZE:
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, use `/top [period] [1-{MAX_LEADERBOARD_SIZE}] [top|bottom]`.")
+            return
+
+        try:
+            start_date, end_date = parse_date_range(period) or (period, period)
+        except ValueError:
+            await send_temporary(ctx, f"{SEPARATOR}\nInvalid date. Use YYYY-MM-DD, YYYY-MM, week, month or YYYY-MM-DD:YYYY-MM-DD.")
+            return
+
+        await ctx.defer()
+        leaderboard = await get_leaderboard(ctx.guild.id, start_date, end_date, count, order == "bottom")
+        if not leaderboard:
+            await send_temporary_after_defer(ctx, f"{SEPARATOR}\nNo records found for {start_date} - {end_date}.")
+            return
+
+        report = [f"{rank}. **{self.bot.user_resolver.mention(ctx.guild, user_id)}** - {minutes:.2f} minutes "
+                  f"over {days} {'day' if days == 1 else 'days'} ({share or 0:.1f}%)"
+                  for rank, user_id, minutes, days, share in leaderboard]
+        title = "Most" if order == "top" else "Least"
+        await send_report(ctx, f"**{title} worked time for {start_date} - {end_date}:**", report)
+        logging.info(f"User {ctx.author} requested the {order} {count} leaderboard for {start_date} - {end_date}.",
+                     extra={'user_id': ctx.author.id, 'date': f"{start_date}:{end_date}"})
+
+    @commands.command()
+    async def export(self, ctx, period: str = None, export_format: str = "csv"):
+        """Upload every session of a date or period as a CSV or JSONL file (default: today)"""
+        await ctx.message.delete()
+        if not is_allowed_admin_channel(ctx):
+            await ctx.send(f"{SEPARATOR}\n{ctx.author.mention}, {channel_requirement(ctx.guild, 'admin_channel')}", delete_after=3)
+            return
+
+        if not (has_required_hr_role(ctx) or has_required_conducere_role(ctx)):
+            await ctx.send(f"{SEPARATOR}\n{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        if export_format not in EXPORT_FORMATS:
+            await ctx.send(f"{SEPARATOR}\n{ctx.author.mention}, the format must be one of: {', '.join(EXPORT_FORMATS)}.", delete_after=3)
+            return
+
+        if period is None:
+            period = datetime.datetime.now().strftime("%Y-%m-%d")
+        try:
+            start_date, end_date = parse_date_range(period) or (period, period)
+        except ValueError:
+            await ctx.send(f"{SEPARATOR}\nInvalid date. Use YYYY-MM-DD, YYYY-MM, week, month or YYYY-MM-DD:YYYY-MM-DD.", delete_after=3)
+            return
+
+        path = await export_timesheet(ctx.guild.id, start_date, end_date, export_format)
+        try:
+            if os.path.getsize(path) > ctx.guild.filesize_limit:
+                await ctx.send(f"{SEPARATOR}\n{ctx.author.mention}, the export is too large to upload. Please use a shorter period.", delete_after=3)
+                return
+            filename = f"timesheet_{start_date}_{end_date}.{export_format}"
+            await ctx.send(f"{SEPARATOR}\n**Timesheet export for {start_date} - {end_date}:**", file=discord.File(path, filename=filename))
+            logging.info(f"User {ctx.author} exported the timesheet for {start_date} - {end_date} as {export_format}.")
+        finally:
+            os.remove(path)
+
+    @commands.hybrid_command()
+    async def rmv(self, ctx, user: discord.Member, date: str, index: int):
+        """Remove a specific clock-in/out session for a user on a specific date by index"""
+        await delete_invocation(ctx)
+        if not is_allowed_admin_channel(ctx):
+            await send_temporary(ctx, f"{ctx.author.mention}, {channel_requirement(ctx.guild, 'admin_channel')}")
+            return
+
+        if not has_required_hr_role(ctx):
+            await send_temporary(ctx, f"{ctx.author.mention}, you do not have permission to use this command.")
+            return
+
+        user_id = user.id
+        sessions = await get_clock_times(ctx.guild.id, user_id, date)
+
+        if index < 1 or index > len(sessions):
+            await send_temporary(ctx, f"{ctx.author.mention}, invalid index. Please provide a valid session index.")
+            return
+
+        # Get the session based on the provided index (1-based index)
+        session_id, start_ts, end_ts, _ = sessions[index - 1]
+        session_to_remove = (format_time(start_ts), format_time(end_ts))
+
+        await remove_session(session_id)
+        await ctx.send(f"{ctx.author.mention}, removed session for {user.mention} on {date} at index {index}. Session: {session_to_remove}")
+        await user.send(f"Your session {session_to_remove} on {date} was removed by {ctx.author.mention}.")
+        logging.warning(f"User {ctx.author.mention} removed session for {user.mention} on {date} at index {index}. Session: {session_to_remove}",
+                        extra={'user_id': user_id, 'date': date})
+
+    @commands.hybrid_command()
+    async def ongoing(self, ctx, user: discord.Member = None, action: str = None):
+        """Show ongoing work sessions for all users or stop a specific user's ongoing session"""
+        await delete_invocation(ctx)
+        if not is_allowed_channel(ctx):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.display_name}, {channel_requirement(ctx.guild, 'clock_channel')}")
+            return
+
+        if not (has_required_hr_role(ctx) or has_required_specific_role(ctx)):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, you do not have permission to use this command.")
+            return
+
+        if user and action == "stop" and not (has_required_hr_role(ctx) or has_required_conducere_role(ctx)):
+            await send_temporary(ctx, f"{SEPARATOR}\n{ctx.author.mention}, you do not have permission to stop ongoing sessions.")
+            return
+
+        report = []
+        if user:
+            user_id = user.id
+            sessions = await get_ongoing_sessions(ctx.guild.id, user_id)
+            for session_id, _, _, start_ts in sessions:
+                clock_in = format_time(start_ts)
+                if action == "stop":
+                    await remove_session(session_id)
+                    await ctx.send(f"{SEPARATOR}\n{ctx.author.mention}, stopped and removed clock-in for {user.mention} at {clock_in}.")
+                    await user.send(f"Your clock-in on {clock_in} was stopped by {ctx.author.mention}.")
+                    logging.warning(f"User {ctx.author.mention} stopped and removed clock-in for {user.mention} at {clock_in}.", extra={'user_id': user_id})
+                    return
+                report.append(f"**{user.mention}** - Clocked in at {clock_in}")
+        else:
+            ongoing_sessions = await get_ongoing_sessions(ctx.guild.id)
+            if ongoing_sessions:
+                # Members missing from the cache are fetched from the API, so acknowledge slash commands first
+                await ctx.defer()
+            users = await self.bot.user_resolver.resolve_many(ctx.guild, [user_id for _, user_id, _, _ in ongoing_sessions])
+            for _, user_id, date, start_ts in ongoing_sessions:
+                user = users.get(user_id)
+                mention = user.mention if user else f"<@{user_id}>"
+                report.append(f"**{mention}** - Clocked in at {format_time(start_ts)}")
+
+        if report:
+            await send_report(ctx, "Ongoing work sessions:\n", report)
+        else:
+            await send_temporary(ctx, "No ongoing work sessions found.")
+
+    @commands.hybrid_command()
+    async def addminutes(self, ctx, user: discord.Member, date: str, minutes: float):
+        """Add minutes to the last clock-in session for a user on a specific date or create a new session if none exists"""
+        await delete_invocation(ctx)
+        if not is_allowed_admin_channel(ctx):
+            await send_temporary(ctx, f"{ctx.author.mention}, {channel_requirement(ctx.guild, 'admin_channel')}")
+            return
+
+        if not has_required_hr_role(ctx):
+            await send_temporary(ctx, f"{ctx.author.mention}, you do not have permission to use this command.")
+            return
+
+        user_id = user.id
+        sessions = await get_clock_times(ctx.guild.id, user_id, date)
+
+        if sessions:
+            last_session = sessions[-1]
+            if last_session[2] is None:
+                clock_in_time = datetime.datetime.fromtimestamp(last_session[1])
+                new_clock_out_time = clock_in_time + datetime.timedelta(minutes=minutes)
+                await update_clock_out(ctx.guild.id, user_id, new_clock_out_time, last_session[0])
+                await send_temporary(ctx, f"{ctx.author.mention}, added {minutes:.2f} minutes to {user.mention}'s last session. New clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}")
+                await user.send(f"Your last session on {date} was extended by {minutes:.2f} minutes by {ctx.author.mention}. New clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}. Next time, please use `/clockin` and `/clockout` to avoid this.")
+                logging.warning(f"User {ctx.author.mention} added {minutes:.2f} minutes to {user.mention}'s last session. New clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.",
+                                extra={'user_id': user_id, 'date': date, 'duration': minutes})
+            else:
+                clock_in_time = datetime.datetime.strptime(f"{date} 00:00:00", "%Y-%m-%d %H:%M:%S")
+                new_clock_out_time = clock_in_time + datetime.timedelta(minutes=minutes)
+                await add_session(ctx.guild.id, user_id, clock_in_time, new_clock_out_time)
+                await send_temporary(ctx, f"{ctx.author.mention}, created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}")
+                await user.send(f"Your new session on {date} was created with {minutes:.2f} minutes by {ctx.author.mention}. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}. Next time, please use `/clockin` and  `/clockout` to avoid this.")
+                logging.warning(f"User {ctx.author.mention} created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.",
+                                extra={'user_id': user_id, 'date': date, 'duration': minutes})
+        else:
+            clock_in_time = datetime.datetime.strptime(f"{date} 00:00:00", "%Y-%m-%d %H:%M:%S")
+            new_clock_out_time = clock_in_time + datetime.timedelta(minutes=minutes)
+            await add_session(ctx.guild.id, user_id, clock_in_time, new_clock_out_time)
+            await send_temporary(ctx, f"{ctx.author.mention}, created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}")
+            await user.send(f"Your new session on {date} was created with {minutes:.2f} minutes by {ctx.author.mention}. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}. Next time, please use `/clockin` and  `/clockout` to avoid this.")
+            logging.warning(f"User {ctx.author.mention} created a new session for {user.mention} with {minutes:.2f} minutes. Clock-in time: {clock_in_time.strftime('%H:%M:%S')}, Clock-out time: {new_clock_out_time.strftime('%H:%M:%S')}.",
+                            extra={'user_id': user_id, 'date': date, 'duration': minutes})
+
+async def setup(bot):
+    await bot.add_cog(HR(bot))
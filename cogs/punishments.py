@@ -0,0 +1,87 @@
+import datetime
+import logging
+import discord
+from discord.ext import commands
+from async_database import increment_punish_count, get_punish_count, reset_punish_count, get_warning_history
+from common import (is_allowed_punish_channel, has_required_hr_role, has_required_conducere_role, role_mentions, channel_requirement,
+                    send_report, delete_invocation, send_temporary)
+
+class Punishments(commands.Cog):
+    """Warnings and the warning history"""
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.hybrid_command()
+    async def warn(self, ctx, user: discord.Member,*, message: str = None):
+        """Warn a user, or use `reset`, `?` or `history` as the message"""
+        await delete_invocation(ctx)
+
+        if not message:
+            await send_temporary(ctx, f"{ctx.author.mention}, please provide a message for the warning.")
+            return
+
+        if not (has_required_hr_role(ctx) or has_required_conducere_role(ctx)):
+            await send_temporary(ctx, f"{ctx.author.mention}, you do not have permission to use this command.")
+            return
+
+        if not is_allowed_punish_channel(ctx):
+            await send_temporary(ctx, f"{ctx.author.mention}, {channel_requirement(ctx.guild, 'punish_channel')}")
+            return
+
+        user_id = user.id
+
+        if message.startswith("reset"):
+            if not has_required_conducere_role(ctx):
+                await send_temporary(ctx, f"{ctx.author.mention}, you do not have permission to use this command.")
+                return
+            reset_message = message[5:]
+            afterreset = await reset_punish_count(ctx.guild.id, user_id, ctx.author.id, reset_message.strip())
+            await ctx.send(f"""{ctx.author.mention} has reset the warns count for {user.mention}.
+                       > {user.mention} now has ***{afterreset} / 5 warnings***.
+                       ```{reset_message if reset_message else ''}```""")
+            await user.send(f"""Your warns count has been reset by {ctx.author.mention}. 
+                        > You now have ***{afterreset} / 5 warnings***.
+                        ```{reset_message if reset_message else ''}```""")
+            logging.warning(f"User {ctx.author.mention} reset the warns count for {user.mention}.", extra={'user_id': user_id})
+            return
+        elif message.startswith("?"):
+            current_count = await get_punish_count(ctx.guild.id, user_id)
+            await ctx.send(f"> {user.mention} has ***{current_count} warnings***.")
+            return
+        elif message == "history":
+            await ctx.defer()
+            history = await get_warning_history(ctx.guild.id, user_id)
+            lines = [f"> `{datetime.datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M')}` **{kind}** by <@{issuer_id}>: {entry_message or ''}"
+                     for kind, issuer_id, entry_message, created_at in history]
+            await send_report(ctx, f"**Warning history for {user.mention}:**", lines or ["> No warnings recorded."])
+            return
+
+        # Resolved before the warning is stored, so nothing can fail between storing and announcing it
+        tags = role_mentions(ctx.guild, 'conducere', 'hr')
+        new_count = await increment_punish_count(ctx.guild.id, user_id, ctx.author.id, message, max_count=5)
+
+        if new_count is None:
+            await send_temporary(ctx, f"{ctx.author.mention}, {user.mention} has already reached the maximum number of warns.")
+            return
+
+        if(new_count == 5):
+            tag_line = f"||{tags}||" if tags else ""
+            punish_text=f"""
+        ### {user.mention} got a warning from {ctx.author.mention}.
+        > This is warning number ***{new_count} / 5***.
+        {tag_line}
+        ```{message if message else ''}```
+        """
+        else:
+            punish_text=f"""
+        ### {user.mention} got a warning from {ctx.author.mention}.
+        > This is warning number ***{new_count} / 5***.
+        ```{message if message else ''}```
+        """
+        await ctx.send(punish_text)
+        await user.send("You have been given a warning by the HR team. Check the discord server for more information.")
+
+        logging.warning(punish_text, extra={'user_id': user_id})
+
+async def setup(bot):
+    await bot.add_cog(Punishments(bot))
@@ -0,0 +1,280 @@
+import asyncio
+import datetime
+import logging
+from discord.ext import commands
+from database import to_timestamp, GLOBAL_JOB_KINDS
+from backup import UNDO_PREFIX, list_snapshots
+from async_database import (get_worked_report, get_ongoing_sessions, get_base_timestamp, set_base_timestamp,
+                            archive_sessions, get_archive_summary, incremental_vacuum, supports_backups, backup_database,
+                            restore_database)
+from common import (SEPARATOR, ARCHIVE_AFTER_DAYS, BACKUP_DIR, BACKUP_KEEP, configured_channel, load_guild_configs, role_mentions,
+                    is_owner, is_bot_owner, format_time, pack_messages, send_report)
+
+RENEW_INTERVAL = datetime.timedelta(days=7)
+STALE_SESSION_HOURS = 12  # open sessions older than this are reported by the stale-session sweep
+VACUUM_PAGES = 2000  # free pages returned to the file system per archive job, so one run never blocks writes for long
+MIN_JOB_INTERVAL_HOURS = 1  # shortest interval /schedulejob accepts, so a job cannot keep the scheduler busy
+
+def can_manage(ctx, job):
+    """Check if the user can see and cancel a job: their guild's jobs, or for bot owners the jobs that act on every guild"""
+    if job.kind in GLOBAL_JOB_KINDS:  # they act on every guild's data, so only bot owners manage them
+        return is_bot_owner(ctx)
+    return job.guild_id == ctx.guild.id
+
+class Scheduling(commands.Cog):
+    """Scheduled jobs and the commands that manage them"""
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        self.bot.scheduler.register('renew_reminder', self.send_scheduled_message)
+        self.bot.scheduler.register('stale_session_sweep', self.sweep_stale_sessions)
+        self.bot.scheduler.register('daily_report', self.post_daily_report)
+        self.bot.scheduler.register('archive_sessions', self.archive_old_sessions)
+        self.bot.scheduler.register('backup_database', self.make_backup)
+
+    async def cog_unload(self):
+        for kind in ('renew_reminder', 'stale_session_sweep', 'daily_report', 'archive_sessions', 'backup_database'):
+            self.bot.scheduler.unregister(kind)
+
+    @commands.command()
+    async def starttimestamps(self, ctx, timestamp: str):
+        """Start recurring messages every 7 days from the given timestamp."""
+        await ctx.message.delete()
+
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        try:
+            base_timestamp = datetime.datetime.fromisoformat(timestamp)
+        except ValueError:
+            await ctx.send("Invalid timestamp format. Use ISO format (YYYY-MM-DDTHH:MM:SS).", delete_after=3)
+            return
+
+        await set_base_timestamp(ctx.guild.id, base_timestamp)
+        await self.bot.scheduler.cancel_kind(ctx.guild.id, 'renew_reminder')
+        await self.bot.scheduler.schedule(ctx.guild.id, 'renew_reminder', base_timestamp, RENEW_INTERVAL)
+        await ctx.send(f"> Messages scheduled every 7 days from: ***{base_timestamp}***")
+
+    @commands.command()
+    async def stoptimestamps(self, ctx):
+        """Stop the recurring messages."""
+        await ctx.message.delete()
+
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        await set_base_timestamp(ctx.guild.id, None)
+        await self.bot.scheduler.cancel_kind(ctx.guild.id, 'renew_reminder')
+        await ctx.send("Messages stopped.")
+
+    @commands.command()
+    async def checktimestamps(self, ctx):
+        """Check the base timestamp for the recurring messages."""
+        await ctx.message.delete()
+
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        base_timestamp = await get_base_timestamp(ctx.guild.id)
+        jobs = self.bot.scheduler.get_jobs(ctx.guild.id, 'renew_reminder')
+        next_timestamp = datetime.datetime.fromtimestamp(jobs[0].next_run) if jobs else None
+        await ctx.send(f"Base timestamp for recurring messages: {base_timestamp}\nNext timestamp: {next_timestamp}")
+
+    @commands.command()
+    async def jobs(self, ctx):
+        """List the scheduled jobs"""
+        await ctx.message.delete()
+
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        lines = []
+        for job in filter(lambda job: can_manage(ctx, job), self.bot.scheduler.get_jobs()):
+            every = f", every {datetime.timedelta(seconds=job.interval)}" if job.interval else ""
+            lines.append(f"> `#{job.id}` **{job.kind}** - next run {datetime.datetime.fromtimestamp(job.next_run)}{every}")
+        await send_report(ctx, "**Scheduled jobs:**", lines or ["> No jobs are scheduled."])
+
+    @commands.command()
+    async def schedulejob(self, ctx, kind: str, first_run: str, interval_hours: float = None):
+        """Schedule a job, optionally repeating every interval_hours"""
+        await ctx.message.delete()
+
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        if kind not in self.bot.scheduler.handlers:
+            await ctx.send(f"Unknown job kind. Use one of: {', '.join(self.bot.scheduler.handlers)}.", delete_after=3)
+            return
+        if kind in GLOBAL_JOB_KINDS and not is_bot_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, only the bot owners can schedule `{kind}`.", delete_after=3)
+            return
+        try:
+            first_run_time = datetime.datetime.fromisoformat(first_run)
+        except ValueError:
+            await ctx.send("Invalid timestamp format. Use ISO format (YYYY-MM-DDTHH:MM:SS).", delete_after=3)
+            return
+
+        if interval_hours is not None and interval_hours < MIN_JOB_INTERVAL_HOURS:
+            await ctx.send(f"The interval must be at least {MIN_JOB_INTERVAL_HOURS} hour.", delete_after=3)
+            return
+
+        interval = datetime.timedelta(hours=interval_hours) if interval_hours is not None else None
+        job_id = await self.bot.scheduler.schedule(ctx.guild.id, kind, first_run_time, interval)
+        await ctx.send(f"> Scheduled job `#{job_id}` ({kind}) from ***{first_run_time}***")
+        logging.info(f"User {ctx.author} scheduled job #{job_id} ({kind}) from {first_run_time}, interval {interval}.")
+
+    @commands.command()
+    async def canceljob(self, ctx, job_id: int):
+        """Cancel a scheduled job"""
+        await ctx.message.delete()
+
+        if not is_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        job = self.bot.scheduler.jobs.get(job_id)
+        if job is not None and can_manage(ctx, job) and await self.bot.scheduler.cancel(job_id):
+            await ctx.send(f"> Job `#{job_id}` cancelled.")
+            logging.info(f"User {ctx.author} cancelled job #{job_id}.")
+        else:
+            await ctx.send(f"There is no job `#{job_id}`.", delete_after=3)
+
+    @commands.command()
+    async def archive(self, ctx, action: str = None):
+        """Show the archived months, or archive old sessions now with `run`"""
+        await ctx.message.delete()
+
+        if not is_bot_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        if action == "run":
+            moved, freed = await self.archive_old_sessions(ctx.guild.id, {})
+            await ctx.send(f"> Archived {moved} sessions older than {ARCHIVE_AFTER_DAYS} days and freed {freed} pages.")
+
+        hot_sessions, months = await get_archive_summary()
+        lines = [f"> `{month}` - {sessions} sessions by {users} users, {minutes:.2f} minutes"
+                 for month, users, sessions, minutes in months]
+        await send_report(ctx, f"**Archive:** {hot_sessions} sessions in the hot table, archived months:",
+                          lines or ["> Nothing is archived yet."])
+
+    @commands.command()
+    async def backup(self, ctx, action: str = None, name: str = None):
+        """List the database snapshots, make one now with `run`, or go back to one with `restore [name]`"""
+        await ctx.message.delete()
+
+        if not is_bot_owner(ctx):
+            await ctx.send(f"{ctx.author.mention}, you do not have permission to use this command.", delete_after=3)
+            return
+
+        if not supports_backups():
+            await ctx.send("Backups are not supported for this storage backend.", delete_after=3)
+            return
+
+        try:
+            if action == "run":
+                name, pages = await self.make_backup(ctx.guild.id, {})
+                await ctx.send(f"> Saved snapshot `{name}` ({pages} pages).")
+            elif action == "restore":
+                if not name:
+                    await ctx.send("Use `/backup restore [name]` with a name from `/backup`.", delete_after=3)
+                    return
+                # Keep the current data first, so a restore can be undone by restoring this snapshot
+                undo_name, _, _ = await backup_database(BACKUP_DIR, BACKUP_KEEP, UNDO_PREFIX)
+                await restore_database(BACKUP_DIR, name)
+                # A snapshot from before the data was split by guild is migrated with its rows unassigned
+                await self.bot.claim_legacy_rows(self.bot.legacy_guild_id() or ctx.guild.id)
+                await load_guild_configs()
+                await self.bot.scheduler.reload()
+                # A snapshot from before the maintenance jobs were scheduled by default has none
+                await self.bot.schedule_maintenance()
+                await ctx.send(f"> Restored snapshot `{name}`. The data from before the restore is in `{undo_name}`.")
+                logging.warning(f"User {ctx.author} restored the database from snapshot {name}.")
+                return
+        except ValueError as error:
+            await ctx.send(str(error), delete_after=5)
+            return
+
+        snapshots = await asyncio.to_thread(lambda: list_snapshots(BACKUP_DIR) + list_snapshots(BACKUP_DIR, UNDO_PREFIX))
+        lines = [f"> `{snapshot}` - {size / 1024 / 1024:.2f} MB, sha256 `{(checksum or 'missing')[:12]}`"
+                 for snapshot, size, checksum in snapshots]
+        await send_report(ctx, f"**Snapshots** (the newest {BACKUP_KEEP} are kept):", lines or ["> No snapshots yet."])
+
+    async def make_backup(self, guild_id, payload):
+        """Snapshot the database with the online backup API, without pausing clocking"""
+        if not supports_backups():
+            logging.info("Skipped the scheduled backup, the storage backend has no database file.")
+            return None, 0
+        name, pages, checksum = await backup_database(BACKUP_DIR, payload.get('keep', BACKUP_KEEP))
+        logging.info(f"Saved database snapshot {name} ({pages} pages, sha256 {checksum}).")
+        return name, pages
+
+    async def archive_old_sessions(self, guild_id, payload):
+        """Move finished sessions past the retention period to the archive, then give free pages back to the file system"""
+        after_days = payload.get('after_days', ARCHIVE_AFTER_DAYS)
+        before_date = (datetime.date.today() - datetime.timedelta(days=after_days)).isoformat()
+        moved = await archive_sessions(before_date)
+        freed = await incremental_vacuum(payload.get('vacuum_pages', VACUUM_PAGES))
+        logging.info(f"Archived {moved} sessions from before {before_date} and freed {freed} database pages.")
+        return moved, freed
+
+    def guild_channel(self, guild_id, name, channel_id=None):
+        """Return a job's channel from its own guild, or None if the guild is gone or has not set the channel"""
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return None
+        channel = guild.get_channel(channel_id) if channel_id else configured_channel(guild, name)
+        if channel is None:
+            logging.info(f"Skipped a scheduled post for guild {guild_id}, it has no {name} set.")
+        return channel
+
+    async def send_scheduled_message(self, guild_id, payload=None):
+        """Send the scheduled message and log the event."""
+        channel = self.guild_channel(guild_id, 'renew_channel')
+        if channel:
+            tags = role_mentions(channel.guild, 'hr', 'conducere')
+
+            if tags:
+                await channel.send(f"""||{tags}|| 
+                               **Please RENEW the BOT**
+                               > The next message will be sent in 7 days.
+                               `This message was sent on {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`
+                               """)
+            else:
+                await channel.send("Please RENEW the BOT")
+
+    async def sweep_stale_sessions(self, guild_id, payload):
+        """Report sessions that have been open for too long to the guild's logs channel"""
+        channel = self.guild_channel(guild_id, 'logs_channel')
+        if channel is None:
+            return
+        max_hours = payload.get('max_hours', STALE_SESSION_HOURS)
+        cutoff = to_timestamp(datetime.datetime.now()) - max_hours * 3600
+        stale = [(user_id, date, start_ts) for _, user_id, date, start_ts in await get_ongoing_sessions(guild_id) if start_ts < cutoff]
+        if not stale:
+            return
+        lines = [f"**{self.bot.user_resolver.mention(channel.guild, user_id)}** - Clocked in on {date} at {format_time(start_ts)}"
+                 for user_id, date, start_ts in stale]
+        for message in pack_messages([f"Sessions open for more than {max_hours} hours:\n", *lines]):
+            await channel.send(message)
+        logging.info(f"Stale-session sweep found {len(stale)} sessions open for more than {max_hours} hours.")
+
+    async def post_daily_report(self, guild_id, payload):
+        """Post yesterday's worked time report"""
+        channel = self.guild_channel(guild_id, 'admin_channel', payload.get('channel_id'))
+        if channel is None:
+            return
+        date = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        report = [f"**{self.bot.user_resolver.mention(channel.guild, user_id)}** - Total: ({total_minutes:.2f}) minutes"
+                  for user_id, total_minutes, _ in await get_worked_report(guild_id, date) if total_minutes > 0]
+        for message in pack_messages([f"{SEPARATOR}\n**Worked time report for {date}:**", *(report or [f"No records found for {date}."])], "\n\n"):
+            await channel.send(message)
+
+async def setup(bot):
+    await bot.add_cog(Scheduling(bot))
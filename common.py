@@ -0,0 +1,381 @@
+import asyncio
+import calendar
+import datetime
+import logging
+import os
+import time
+from collections import OrderedDict
+import discord
+from dotenv import load_dotenv
+from async_database import get_guild_settings, set_guild_setting
+
+# Configuration and helpers shared by bot.py and the command modules in cogs/.
+# This module is not reloaded with the cogs, so the config and role caches survive reloads.
+
+def parse_id(value):
+    """Read a user, channel or role ID, also when it is given as a mention"""
+    return int(value.strip().strip('<@#&!>'))
+
+def parse_ids(value):
+    return frozenset(parse_id(item) for item in value.split(',') if item.strip())
+
+def parse_names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+# Load environment variables from .env file
+load_dotenv()
+LOGS_CHANNEL_ID = int(os.getenv('LOG_CHANNEL_ID', 0))  # log messages that do not come from a guild's command go here
+BOT_OWNER_IDS = parse_ids(os.getenv('OWNER_IDS', '286492096242909185'))  # users who can run the owner commands in every guild
+LEGACY_GUILD_ID = int(os.getenv('LEGACY_GUILD_ID', 0))  # guild that owns the data stored before the bot served several guilds
+CLOCK_CONCURRENCY = int(os.getenv('CLOCK_CONCURRENCY', 10))  # clock commands processed at the same time, the rest wait in line
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))  # finished sessions older than this are moved to the archive
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')  # database snapshots and their checksums are kept here
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 7))  # older snapshots are deleted once a new one is made
+
+# Settings each guild can change with /config, and the .env variable used as
+# the default while the legacy guild has not set them. Other guilds have no
+# defaults, so they never use the channels and roles of the original server.
+GUILD_SETTINGS = {
+    'clock_channel': ('ALLOWED_CHANNEL_ID', parse_id),
+    'admin_channel': ('ALLOWED_ADMIN_CHANNEL_ID', parse_id),
+    'punish_channel': ('ALLOWED_PUNISH_CHANNEL_ID', parse_id),
+    'logs_channel': ('LOG_CHANNEL_ID', parse_id),
+    'renew_channel': ('RENEW_CHANNEL_ID', parse_id),
+    'pd_role': ('REQUIRED_PD_ROLE_NAME', str.strip),
+    'hr_role': ('REQUIRED_HR_ROLE_NAME', str.strip),
+    'specific_roles': ('REQUIRED_PD_SPECIFIC_ROLE_NAME', parse_names),
+    'conducere_role': ('LOGS_TAG_ROLE_NAME', str.strip),
+    'atributii_role': ('ATRIBUTII_ROLE_NAME', str.strip),
+    'owners': (None, parse_ids),
+}
+
+NOT_CONFIGURED = "this server is not configured yet, an admin must run /config"
+
+class GuildConfig:
+    """A guild's settings: the ones it stored with /config, and for the legacy guild the .env defaults for the rest"""
+    def __init__(self, guild_id, stored=None):
+        self.guild_id = guild_id
+        self.stored = dict(stored or {})
+        env_defaults = guild_id == legacy_guild_id
+        for name, (variable, parse) in GUILD_SETTINGS.items():
+            value = self.stored.get(name, os.getenv(variable) if variable and env_defaults else None)
+            setattr(self, name, parse(value) if value else None)
+
+guild_configs = {}  # guild_id -> GuildConfig
+legacy_guild_id = LEGACY_GUILD_ID or None  # the guild using the .env defaults, remembered once it claimed the legacy rows
+
+def get_config(guild_id):
+    """Return a guild's cached settings"""
+    config = guild_configs.get(guild_id)
+    if config is None:
+        config = guild_configs[guild_id] = GuildConfig(guild_id)
+    return config
+
+async def load_guild_configs():
+    """Cache the stored settings of every guild, so commands never query them"""
+    global legacy_guild_id
+    stored = {}
+    for guild_id, name, value in await get_guild_settings():
+        stored.setdefault(guild_id, {})[name] = value
+    # Guild 0 holds the settings of the bot itself
+    if not LEGACY_GUILD_ID and 'legacy_guild' in stored.get(0, {}):
+        legacy_guild_id = int(stored[0]['legacy_guild'])
+    guild_configs.clear()
+    guild_configs.update((guild_id, GuildConfig(guild_id, settings)) for guild_id, settings in stored.items() if guild_id)
+    role_id_cache.clear()
+
+async def set_legacy_guild(guild_id):
+    """Remember the guild that claimed the legacy rows, so it keeps the .env defaults when the bot joins more guilds"""
+    global legacy_guild_id
+    previous, legacy_guild_id = legacy_guild_id, guild_id
+    await set_guild_setting(0, 'legacy_guild', str(guild_id))
+    for changed in (previous, guild_id):
+        if changed in guild_configs:
+            guild_configs[changed] = GuildConfig(changed, guild_configs[changed].stored)
+        role_id_cache.pop(changed, None)
+
+async def set_config(guild_id, name, value):
+    """Store a guild setting, or reset it to the default when value is None. Raises ValueError for a bad value."""
+    if value is not None:
+        value = value.strip()
+        GUILD_SETTINGS[name][1](value)
+    await set_guild_setting(guild_id, name, value)
+    stored = dict(get_config(guild_id).stored)
+    if value is None:
+        stored.pop(name, None)
+    else:
+        stored[name] = value
+    guild_configs[guild_id] = GuildConfig(guild_id, stored)
+    role_id_cache.pop(guild_id, None)
+
+def configured_channel(guild, name):
+    """Return the guild's channel for a channel setting, or None if it is not set or not in the guild"""
+    channel_id = getattr(get_config(guild.id), name)
+    return guild.get_channel(channel_id) if channel_id else None
+
+def channel_requirement(guild, name):
+    """Tell the user where a command can be used, or that the guild has not set that channel yet"""
+    channel = configured_channel(guild, name)
+    return f"you can only use this command in {channel.mention}." if channel else f"{NOT_CONFIGURED}."
+
+def is_bot_owner(ctx):
+    """Check if the user can run the owner commands that affect every guild"""
+    return ctx.author.id in BOT_OWNER_IDS
+
+def is_owner(ctx):
+    """Check if the user can manage the bot in this guild: a bot owner, the guild's owner or one of its configured owners"""
+    if is_bot_owner(ctx):
+        return True
+    return ctx.guild is not None and (ctx.author.id == ctx.guild.owner_id or ctx.author.id in (get_config(ctx.guild.id).owners or ()))
+
+MAX_MESSAGE_LENGTH = 2000
+
+SEPARATOR = "```--------------------------------------------------------```"
+
+def pack_messages(entries, separator="\n", limit=MAX_MESSAGE_LENGTH):
+    """Join entries into as few messages as possible, each at most limit characters long"""
+    messages = []
+    current = ""
+    for entry in entries:
+        while len(entry) > limit:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(entry[:limit])
+            entry = entry[limit:]
+        if current and len(current) + len(separator) + len(entry) > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}{separator}{entry}" if current else entry
+    if current:
+        messages.append(current)
+    return messages
+
+def parse_date_range(period):
+    """Turn a /worked period into (start_date, end_date), or None if it is a single date.
+
+    Accepts `week` (Monday to today), `month` (the 1st to today), `YYYY-MM`
+    (the whole month) and `YYYY-MM-DD:YYYY-MM-DD`. Raises ValueError for bad dates.
+    """
+    today = datetime.date.today()
+    if period == "week":
+        return (today - datetime.timedelta(days=today.weekday())).isoformat(), today.isoformat()
+    if period == "month":
+        return today.replace(day=1).isoformat(), today.isoformat()
+    if ":" in period:
+        start, end = period.split(":", 1)
+        return datetime.date.fromisoformat(start).isoformat(), datetime.date.fromisoformat(end).isoformat()
+    if len(period) == 7:
+        first = datetime.date.fromisoformat(f"{period}-01")
+        last_day = calendar.monthrange(first.year, first.month)[1]
+        return first.isoformat(), first.replace(day=last_day).isoformat()
+    datetime.date.fromisoformat(period)
+    return None
+
+def format_time(timestamp):
+    """Format a stored epoch timestamp as a local HH:MM:SS time"""
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+
+class UserResolver:
+    """Resolve user IDs to users for reports.
+
+    Members come from the guild cache. Other users are fetched from the API at
+    most `concurrency` at a time and kept in an LRU cache for `ttl` seconds, so
+    stale sessions of users who left the guild do not cost a request every time.
+    """
+    def __init__(self, bot, max_size=1000, ttl=3600, concurrency=5):
+        self.bot = bot
+        self.max_size = max_size
+        self.ttl = ttl
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = OrderedDict()  # user_id -> (expires_at, user or None)
+
+    def cached(self, guild, user_id):
+        """Return (found, user) without making any API call"""
+        member = guild.get_member(user_id)
+        if member:
+            return True, member
+        entry = self.cache.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            self.cache.move_to_end(user_id)
+            return True, entry[1]
+        user = self.bot.get_user(user_id)
+        return (True, user) if user else (False, None)
+
+    def mention(self, guild, user_id):
+        """Mention a user without resolving them; a raw mention renders the same"""
+        _, user = self.cached(guild, user_id)
+        return user.mention if user else f"<@{user_id}>"
+
+    async def fetch(self, user_id):
+        async with self.semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                user = None
+            except discord.HTTPException as error:
+                # Rate limits and server errors are temporary, so the user is not cached and is fetched again next time
+                logging.info(f"Could not fetch user {user_id}: {error}")
+                return None
+        self.cache[user_id] = (time.monotonic() + self.ttl, user)
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+        return user
+
+    async def resolve_many(self, guild, user_ids):
+        """Resolve user IDs in one concurrent round of lookups; users that cannot be found map to None"""
+        users = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            found, user = self.cached(guild, user_id)
+            if found:
+                users[user_id] = user
+            else:
+                missing.append(user_id)
+        if missing:
+            fetched = await asyncio.gather(*(self.fetch(user_id) for user_id in missing))
+            users.update(zip(missing, fetched))
+        return users
+
+MAX_REPORT_MESSAGES = 3  # larger reports are shown as one message with page buttons
+
+class ReportPages(discord.ui.View):
+    """Previous/Next buttons that flip one message through the pages of a large report"""
+    def __init__(self, author_id, pages):
+        super().__init__(timeout=600)
+        self.author_id = author_id
+        self.pages = pages
+        self.index = 0
+        self.message = None
+        self.update_buttons()
+
+    def render(self):
+        return f"{self.pages[self.index]}\n`Page {self.index + 1}/{len(self.pages)}`"
+
+    def update_buttons(self):
+        self.previous.disabled = self.index == 0
+        self.next.disabled = self.index == len(self.pages) - 1
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.author_id
+
+    async def flip(self, interaction, step):
+        self.index += step
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        await self.flip(interaction, -1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        await self.flip(interaction, 1)
+
+    async def on_timeout(self):
+        if self.message:
+            await self.message.edit(view=None)
+
+async def send_report(ctx, header, entries, separator="\n"):
+    """Send a report in as few messages as fit, or as one paged message if it is very large"""
+    entries = [f"{SEPARATOR}\n{header}", *entries]
+    messages = pack_messages(entries, separator)
+    if len(messages) <= MAX_REPORT_MESSAGES:
+        for message in messages:
+            await ctx.send(message)
+        return
+    footer_length = len(f"\n`Page {len(messages)}/{len(messages)}`") + 2
+    view = ReportPages(ctx.author.id, pack_messages(entries, separator, MAX_MESSAGE_LENGTH - footer_length))
+    view.message = await ctx.send(view.render(), view=view)
+
+async def delete_invocation(ctx):
+    """Delete the message that invoked a prefix command. Slash commands have no message to delete."""
+    if ctx.interaction is None:
+        await ctx.message.delete()
+
+async def send_temporary(ctx, content):
+    """Reply only for the invoking user: ephemerally to a slash command, or with a message deleted after 3 seconds"""
+    if ctx.interaction is not None:
+        return await ctx.send(content, ephemeral=True)
+    return await ctx.send(content, delete_after=3)
+
+async def send_temporary_after_defer(ctx, content):
+    """Like send_temporary, after ctx.defer(): the deferred public response of a slash command is deleted first,
+    since a followup would otherwise take its visibility"""
+    if ctx.interaction is not None:
+        await ctx.interaction.delete_original_response()
+        return await ctx.interaction.followup.send(content, ephemeral=True)
+    return await ctx.send(content, delete_after=3)
+
+def is_allowed_channel(ctx):
+    """Check if the command is issued in the allowed channel"""
+    return ctx.channel.id == get_config(ctx.guild.id).clock_channel
+
+def is_allowed_admin_channel(ctx):
+    """Check if the command is issued in the allowed admin channel"""
+    return ctx.channel.id == get_config(ctx.guild.id).admin_channel
+
+def is_allowed_punish_channel(ctx):
+    """Check if the command is issued in the allowed admin channel"""
+    return ctx.channel.id == get_config(ctx.guild.id).punish_channel
+
+# The role settings behind each role key, resolved to role IDs once per guild
+ROLE_SETTINGS = {
+    'pd': 'pd_role',
+    'hr': 'hr_role',
+    'conducere': 'conducere_role',
+    'atributii': 'atributii_role',
+}
+
+role_id_cache = {}
+
+def refresh_role_ids(guild):
+    """Resolve the configured role names of a guild to role IDs in one pass over its roles"""
+    config = get_config(guild.id)
+    ids_by_name = {}
+    for role in guild.roles:
+        ids_by_name.setdefault(role.name, role.id)
+    role_ids = {key: ids_by_name.get(getattr(config, setting)) for key, setting in ROLE_SETTINGS.items()}
+    role_ids['specific'] = frozenset(role.id for role in guild.roles if role.name in (config.specific_roles or ()))
+    role_id_cache[guild.id] = role_ids
+    return role_ids
+
+def get_role_ids(guild):
+    """Return the cached role IDs of a guild"""
+    role_ids = role_id_cache.get(guild.id)
+    if role_ids is None:
+        role_ids = refresh_role_ids(guild)
+    return role_ids
+
+def get_role(guild, key):
+    """Return a configured role of a guild, or None if the guild does not have it"""
+    role_id = get_role_ids(guild)[key]
+    return guild.get_role(role_id) if role_id else None
+
+def role_mentions(guild, *keys):
+    """Mention the configured roles of a guild that exist, skipping the ones it does not have"""
+    return "".join(role.mention for role in (get_role(guild, key) for key in keys) if role)
+
+def member_role_ids(member):
+    return {role.id for role in member.roles}
+
+# this one is for the pd role check
+def has_required_pd_role(ctx):
+    """Check if the user has the required role"""
+    return get_role_ids(ctx.guild)['pd'] in member_role_ids(ctx.author)
+
+# check hr role
+def has_required_hr_role(ctx):
+    """Check if the user has the required role"""
+    return get_role_ids(ctx.guild)['hr'] in member_role_ids(ctx.author)
+
+# check asp+ role for ongoing
+def has_required_specific_role(ctx):
+    return not get_role_ids(ctx.guild)['specific'].isdisjoint(member_role_ids(ctx.author))
+
+def has_required_conducere_role(ctx):
+    """Check if the user has the required role"""
+    return get_role_ids(ctx.guild)['conducere'] in member_role_ids(ctx.author)
@@ -1,9 +1,58 @@
+import os
 import sqlite3
 import datetime
+import itertools
+import threading
+import time
 
-def init_db():
-    conn = sqlite3.connect('clock_times.db')
-    c = conn.cursor()
+# Clock sessions, jobs and punishments all live in this one database file
+DB_PATH = 'clock_times.db'
+LEGACY_PUNISH_DB = 'punishments.db'  # punishments were kept in their own file before schema version 8
+RENEW_INTERVAL = 7 * 24 * 3600  # seconds between renew reminders
+GLOBAL_JOB_KINDS = ('archive_sessions', 'backup_database')  # jobs that act on every guild's data, so they belong to no guild
+BACKUP_PAGES = 256  # pages copied per online backup step; other connections read and write between steps
+
+# Connections are kept open per thread and per database file, so every query
+# reuses a long-lived connection instead of opening a new one.
+_local = threading.local()
+_all_connections = []
+_all_connections_lock = threading.Lock()
+_connections_opened = 0
+
+def get_connection(path):
+    """Return this thread's persistent connection to the given database file."""
+    global _connections_opened
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.create_function('round_minutes', 1, round_minutes, deterministic=True)
+        connections[path] = conn
+        with _all_connections_lock:
+            _all_connections.append(conn)
+            _connections_opened += 1
+    return conn
+
+def connection_counts():
+    """Return (open connections, connections opened since startup)."""
+    with _all_connections_lock:
+        return len(_all_connections), _connections_opened
+
+def close_connections():
+    """Close every connection opened by any thread. Only call this on shutdown."""
+    with _all_connections_lock:
+        for conn in _all_connections:
+            conn.close()
+        _all_connections.clear()
+
+# Schema migrations. The database stores the number of migrations applied in
+# PRAGMA user_version, and init_db() applies the missing ones in order, so old
+# database files are upgraded in place at startup.
+def _clock_v1(c):
     c.execute('''CREATE TABLE IF NOT EXISTS clock_times (
                  user_id INTEGER,
                  date TEXT,
@@ -12,94 +61,707 @@ def init_db():
     c.execute('''CREATE TABLE IF NOT EXISTS timestamps (
                  id INTEGER PRIMARY KEY,
                  base_timestamp TEXT)''')
-    conn.commit()
-    conn.close()
 
-def get_base_timestamp():
-    """Retrieve the base timestamp from the database."""
-    conn = sqlite3.connect('clock_times.db')
+def _clock_v2(c):
+    """Give every session a row id and index the lookups done by the bot."""
+    c.execute('''CREATE TABLE clock_times_new (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 user_id INTEGER NOT NULL,
+                 date TEXT NOT NULL,
+                 clock_in TEXT,
+                 clock_out TEXT)''')
+    c.execute('''INSERT INTO clock_times_new (user_id, date, clock_in, clock_out)
+                 SELECT user_id, date, clock_in, clock_out FROM clock_times ORDER BY rowid''')
+    c.execute("DROP TABLE clock_times")
+    c.execute("ALTER TABLE clock_times_new RENAME TO clock_times")
+    c.execute("CREATE INDEX idx_clock_times_user_date ON clock_times (user_id, date)")
+    c.execute("CREATE INDEX idx_clock_times_open ON clock_times (user_id, date, clock_in) WHERE clock_out IS NULL")
+
+def _clock_v3(c):
+    c.execute("CREATE INDEX idx_clock_times_date ON clock_times (date)")
+
+def _clock_v4(c):
+    """Store sessions as epoch seconds with a duration filled in at clock-out.
+
+    date stays as the day the session started on, so reports keep grouping by
+    it, while start_ts/end_ts let a session run past midnight.
+    """
+    c.execute('''CREATE TABLE clock_times_new (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 user_id INTEGER NOT NULL,
+                 date TEXT NOT NULL,
+                 start_ts INTEGER NOT NULL,
+                 end_ts INTEGER,
+                 duration INTEGER)''')
+    c.execute("SELECT id, user_id, date, clock_in, clock_out FROM clock_times ORDER BY id")
+    converted = []
+    for session_id, user_id, date, clock_in, clock_out in c.fetchall():
+        start = datetime.datetime.strptime(f"{date} {clock_in or '00:00:00'}", "%Y-%m-%d %H:%M:%S")
+        end_ts = duration = None
+        if clock_out:
+            end = datetime.datetime.strptime(f"{date} {clock_out}", "%Y-%m-%d %H:%M:%S")
+            if end < start:
+                # The old format only kept times of day, so this session ended after midnight.
+                end += datetime.timedelta(days=1)
+            end_ts = to_timestamp(end)
+            duration = end_ts - to_timestamp(start)
+        converted.append((session_id, user_id, date, to_timestamp(start), end_ts, duration))
+    c.executemany("INSERT INTO clock_times_new (id, user_id, date, start_ts, end_ts, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                  converted)
+    c.execute("DROP TABLE clock_times")
+    c.execute("ALTER TABLE clock_times_new RENAME TO clock_times")
+    c.execute("CREATE INDEX idx_clock_times_user_date ON clock_times (user_id, date)")
+    c.execute("CREATE INDEX idx_clock_times_date ON clock_times (date)")
+    c.execute("CREATE INDEX idx_clock_times_open ON clock_times (user_id, date, start_ts) WHERE end_ts IS NULL")
+
+def _clock_v5(c):
+    """Allow at most one open session per user.
+
+    Older versions could leave several sessions open for the same user; all
+    but the newest are closed with a zero duration, which is what reports
+    already counted them as.
+    """
+    c.execute('''UPDATE clock_times SET end_ts = start_ts, duration = 0
+                 WHERE end_ts IS NULL AND id NOT IN (
+                     SELECT MAX(id) FROM clock_times WHERE end_ts IS NULL GROUP BY user_id)''')
+    c.execute("DROP INDEX idx_clock_times_open")
+    c.execute("CREATE UNIQUE INDEX idx_clock_times_open ON clock_times (user_id) WHERE end_ts IS NULL")
+
+def _clock_v6(c):
+    """Add the per-user daily rollup that range reports read from."""
+    c.execute('''CREATE TABLE daily_totals (
+                 user_id INTEGER NOT NULL,
+                 date TEXT NOT NULL,
+                 minutes INTEGER NOT NULL,
+                 sessions INTEGER NOT NULL,
+                 PRIMARY KEY (user_id, date))''')
+    c.execute("CREATE INDEX idx_daily_totals_date ON daily_totals (date)")
+    c.execute('''INSERT INTO daily_totals (user_id, date, minutes, sessions)
+                 SELECT user_id, date, SUM(round_minutes(duration / 60.0)), COUNT(duration)
+                 FROM clock_times WHERE duration IS NOT NULL GROUP BY user_id, date''')
+
+def _clock_v7(c):
+    """Add the scheduler's job table and turn the renew reminder base timestamp into a job."""
+    c.execute('''CREATE TABLE jobs (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 kind TEXT NOT NULL,
+                 next_run INTEGER NOT NULL,
+                 interval INTEGER,
+                 payload TEXT)''')
+    c.execute("CREATE INDEX idx_jobs_kind ON jobs (kind)")
+    c.execute("SELECT base_timestamp FROM timestamps WHERE id = 1 AND base_timestamp IS NOT NULL")
+    row = c.fetchone()
+    if row:
+        c.execute("INSERT INTO jobs (kind, next_run, interval) VALUES ('renew_reminder', ?, ?)",
+                  (to_timestamp(datetime.datetime.fromisoformat(row[0])), RENEW_INTERVAL))
+
+def _punish_v1(c):
+    c.execute("CREATE TABLE IF NOT EXISTS punishments (user_id INTEGER PRIMARY KEY, count INTEGER)")
+
+def _punish_v2(c):
+    """Add the warning history, indexed by user and time."""
+    c.execute('''CREATE TABLE warnings (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 user_id INTEGER NOT NULL,
+                 issuer_id INTEGER,
+                 kind TEXT NOT NULL,
+                 message TEXT,
+                 created_at INTEGER NOT NULL)''')
+    c.execute("CREATE INDEX idx_warnings_user_time ON warnings (user_id, created_at)")
+
+def _clock_v8(c):
+    """Move the punishments and warning history into the main database file."""
+    _punish_v1(c)
+    _punish_v2(c)
+    legacy_path = os.path.join(os.path.dirname(DB_PATH), LEGACY_PUNISH_DB)
+    if not os.path.exists(legacy_path) or os.path.abspath(legacy_path) == os.path.abspath(DB_PATH):
+        return
+    legacy = sqlite3.connect(f"file:{legacy_path}?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in legacy.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'punishments' in tables:
+            c.executemany("INSERT OR REPLACE INTO punishments (user_id, count) VALUES (?, ?)",
+                          legacy.execute("SELECT user_id, count FROM punishments"))
+        if 'warnings' in tables:
+            c.executemany("INSERT INTO warnings (user_id, issuer_id, kind, message, created_at) VALUES (?, ?, ?, ?, ?)",
+                          legacy.execute("SELECT user_id, issuer_id, kind, message, created_at FROM warnings ORDER BY id"))
+    finally:
+        legacy.close()
+
+def _clock_v9(c):
+    """Add the session archive, its per-user monthly summaries and a view over hot and archived sessions.
+
+    The archive has no rowid and its primary key starts with the date, so the
+    sessions of a month are stored together and read with one range scan.
+    """
+    c.execute('''CREATE TABLE clock_archive (
+                 id INTEGER NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 date TEXT NOT NULL,
+                 start_ts INTEGER NOT NULL,
+                 end_ts INTEGER NOT NULL,
+                 duration INTEGER NOT NULL,
+                 PRIMARY KEY (date, user_id, id)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE monthly_totals (
+                 month TEXT NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 minutes INTEGER NOT NULL,
+                 sessions INTEGER NOT NULL,
+                 days INTEGER NOT NULL,
+                 PRIMARY KEY (month, user_id)) WITHOUT ROWID''')
+    c.execute('''CREATE VIEW all_sessions AS
+                 SELECT id, user_id, date, start_ts, end_ts, duration FROM clock_times
+                 UNION ALL
+                 SELECT id, user_id, date, start_ts, end_ts, duration FROM clock_archive''')
+
+def _clock_v10(c):
+    """Partition every table by guild and add the per-guild settings.
+
+    Rows stored before this version get guild_id 0 until claim_unassigned_rows()
+    gives them to the guild the bot used to serve. The timestamps table keeps
+    one row per guild from now on, with the guild ID as its id.
+    """
+    c.execute("DROP VIEW all_sessions")
+    c.execute("ALTER TABLE clock_times ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0")
+    c.execute("DROP INDEX idx_clock_times_user_date")
+    c.execute("DROP INDEX idx_clock_times_date")
+    c.execute("DROP INDEX idx_clock_times_open")
+    c.execute("CREATE INDEX idx_clock_times_user_date ON clock_times (guild_id, user_id, date)")
+    c.execute("CREATE INDEX idx_clock_times_date ON clock_times (guild_id, date)")
+    c.execute("CREATE UNIQUE INDEX idx_clock_times_open ON clock_times (guild_id, user_id) WHERE end_ts IS NULL")
+
+    c.execute('''CREATE TABLE clock_archive_new (
+                 guild_id INTEGER NOT NULL,
+                 id INTEGER NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 date TEXT NOT NULL,
+                 start_ts INTEGER NOT NULL,
+                 end_ts INTEGER NOT NULL,
+                 duration INTEGER NOT NULL,
+                 PRIMARY KEY (guild_id, date, user_id, id)) WITHOUT ROWID''')
+    c.execute('''INSERT INTO clock_archive_new (guild_id, id, user_id, date, start_ts, end_ts, duration)
+                 SELECT 0, id, user_id, date, start_ts, end_ts, duration FROM clock_archive''')
+    c.execute("DROP TABLE clock_archive")
+    c.execute("ALTER TABLE clock_archive_new RENAME TO clock_archive")
+    c.execute('''CREATE VIEW all_sessions AS
+                 SELECT guild_id, id, user_id, date, start_ts, end_ts, duration FROM clock_times
+                 UNION ALL
+                 SELECT guild_id, id, user_id, date, start_ts, end_ts, duration FROM clock_archive''')
+
+    c.execute('''CREATE TABLE daily_totals_new (
+                 guild_id INTEGER NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 date TEXT NOT NULL,
+                 minutes INTEGER NOT NULL,
+                 sessions INTEGER NOT NULL,
+                 PRIMARY KEY (guild_id, user_id, date))''')
+    c.execute('''INSERT INTO daily_totals_new (guild_id, user_id, date, minutes, sessions)
+                 SELECT 0, user_id, date, minutes, sessions FROM daily_totals''')
+    c.execute("DROP TABLE daily_totals")
+    c.execute("ALTER TABLE daily_totals_new RENAME TO daily_totals")
+    c.execute("CREATE INDEX idx_daily_totals_date ON daily_totals (guild_id, date)")
+
+    c.execute('''CREATE TABLE monthly_totals_new (
+                 guild_id INTEGER NOT NULL,
+                 month TEXT NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 minutes INTEGER NOT NULL,
+                 sessions INTEGER NOT NULL,
+                 days INTEGER NOT NULL,
+                 PRIMARY KEY (guild_id, month, user_id)) WITHOUT ROWID''')
+    c.execute('''INSERT INTO monthly_totals_new (guild_id, month, user_id, minutes, sessions, days)
+                 SELECT 0, month, user_id, minutes, sessions, days FROM monthly_totals''')
+    c.execute("DROP TABLE monthly_totals")
+    c.execute("ALTER TABLE monthly_totals_new RENAME TO monthly_totals")
+
+    c.execute('''CREATE TABLE punishments_new (
+                 guild_id INTEGER NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 count INTEGER,
+                 PRIMARY KEY (guild_id, user_id))''')
+    c.execute("INSERT INTO punishments_new (guild_id, user_id, count) SELECT 0, user_id, count FROM punishments")
+    c.execute("DROP TABLE punishments")
+    c.execute("ALTER TABLE punishments_new RENAME TO punishments")
+
+    c.execute("ALTER TABLE warnings ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0")
+    c.execute("DROP INDEX idx_warnings_user_time")
+    c.execute("CREATE INDEX idx_warnings_user_time ON warnings (guild_id, user_id, created_at)")
+    c.execute("ALTER TABLE jobs ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0")
+    c.execute("UPDATE timestamps SET id = 0 WHERE id = 1")
+
+    c.execute('''CREATE TABLE guild_settings (
+                 guild_id INTEGER NOT NULL,
+                 name TEXT NOT NULL,
+                 value TEXT NOT NULL,
+                 PRIMARY KEY (guild_id, name)) WITHOUT ROWID''')
+
+MIGRATIONS = [_clock_v1, _clock_v2, _clock_v3, _clock_v4, _clock_v5, _clock_v6, _clock_v7, _clock_v8, _clock_v9,
+              _clock_v10]
+
+def get_schema_version(path):
+    conn = get_connection(path)
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(path, migrations):
+    """Apply every migration newer than the database's schema version, each in its own transaction."""
+    conn = get_connection(path)
+    version = get_schema_version(path)
+    for number, migration in enumerate(migrations[version:], start=version + 1):
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            migration(c)
+            c.execute(f'PRAGMA user_version = {number}')
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+def configure(path):
+    """Use a different database file. Call this before the first query."""
+    global DB_PATH
+    DB_PATH = path
+
+def _enable_incremental_vacuum(conn):
+    """Let incremental_vacuum() give free pages back to the file system.
+
+    Files created before this setting existed have to be rebuilt once with a
+    full VACUUM for it to take effect.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+
+def init_db():
+    migrate(DB_PATH, MIGRATIONS)
+    _enable_incremental_vacuum(get_connection(DB_PATH))
+
+def claim_unassigned_rows(guild_id):
+    """Give the rows stored before data was partitioned by guild to a guild, and return how many sessions moved.
+
+    Rows that would collide with ones the guild already has keep guild_id 0, and
+    so do the jobs in GLOBAL_JOB_KINDS.
+    """
+    conn = get_connection(DB_PATH)
+    with conn:
+        c = conn.cursor()
+        c.execute("UPDATE OR IGNORE clock_times SET guild_id = ? WHERE guild_id = 0", (guild_id,))
+        claimed = c.rowcount
+        c.execute("UPDATE OR IGNORE clock_archive SET guild_id = ? WHERE guild_id = 0", (guild_id,))
+        claimed += c.rowcount
+        for table in ('punishments', 'warnings'):
+            c.execute(f"UPDATE OR IGNORE {table} SET guild_id = ? WHERE guild_id = 0", (guild_id,))
+        c.execute(f"UPDATE jobs SET guild_id = ? WHERE guild_id = 0 AND kind NOT IN ({', '.join('?' * len(GLOBAL_JOB_KINDS))})",
+                  (guild_id, *GLOBAL_JOB_KINDS))
+        c.execute("UPDATE OR IGNORE timestamps SET id = ? WHERE id = 0", (guild_id,))
+        if claimed:
+            _rebuild_daily_totals(c)
+            _rebuild_monthly_totals(c)
+    return claimed
+
+def get_guild_settings():
+    """Return (guild_id, name, value) for every stored guild setting."""
+    conn = get_connection(DB_PATH)
     c = conn.cursor()
-    c.execute('SELECT base_timestamp FROM timestamps WHERE id = 1')
+    c.execute("SELECT guild_id, name, value FROM guild_settings")
+    return c.fetchall()
+
+def set_guild_setting(guild_id, name, value):
+    """Store a guild setting, or remove it when value is None."""
+    conn = get_connection(DB_PATH)
+    with conn:
+        c = conn.cursor()
+        if value is None:
+            c.execute("DELETE FROM guild_settings WHERE guild_id = ? AND name = ?", (guild_id, name))
+        else:
+            c.execute("INSERT OR REPLACE INTO guild_settings (guild_id, name, value) VALUES (?, ?, ?)", (guild_id, name, value))
+
+def get_base_timestamp(guild_id):
+    """Retrieve the guild's base timestamp from the database."""
+    conn = get_connection(DB_PATH)
+    c = conn.cursor()
+    c.execute('SELECT base_timestamp FROM timestamps WHERE id = ?', (guild_id,))
     result = c.fetchone()
-    conn.close()
-    if result:
+    if result and result[0]:
         return datetime.datetime.fromisoformat(result[0])
     return None
 
-def set_base_timestamp(timestamp):
-    """Save the base timestamp in the database."""
-    conn = sqlite3.connect('clock_times.db')
+def set_base_timestamp(guild_id, timestamp):
+    """Save the guild's base timestamp in the database, or clear it when timestamp is None."""
+    conn = get_connection(DB_PATH)
     c = conn.cursor()
-    c.execute('INSERT OR REPLACE INTO timestamps (id, base_timestamp) VALUES (1, ?)', (timestamp.isoformat(),))
+    if timestamp is None:
+        c.execute('DELETE FROM timestamps WHERE id = ?', (guild_id,))
+    else:
+        c.execute('INSERT OR REPLACE INTO timestamps (id, base_timestamp) VALUES (?, ?)', (guild_id, timestamp.isoformat()))
     conn.commit()
-    conn.close()
 
-def add_clock_in(user_id, date, clock_in):
-    conn = sqlite3.connect('clock_times.db')
+def add_job(guild_id, kind, next_run, interval=None, payload=None):
+    """Store a scheduler job and return its id. next_run is epoch seconds, interval is seconds or None for a one-off job."""
+    conn = get_connection(DB_PATH)
+    with conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO jobs (guild_id, kind, next_run, interval, payload) VALUES (?, ?, ?, ?, ?) RETURNING id",
+                  (guild_id, kind, next_run, interval, payload))
+        return c.fetchone()[0]
+
+def get_jobs():
+    """Return (id, guild_id, kind, next_run, interval, payload) for every scheduled job."""
+    conn = get_connection(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT id, guild_id, kind, next_run, interval, payload FROM jobs ORDER BY next_run")
+    return c.fetchall()
+
+def set_job_next_run(job_id, next_run):
+    conn = get_connection(DB_PATH)
     c = conn.cursor()
-    c.execute("INSERT INTO clock_times (user_id, date, clock_in, clock_out) VALUES (?, ?, ?, ?)",
-              (user_id, date, clock_in, None))
+    c.execute("UPDATE jobs SET next_run = ? WHERE id = ?", (next_run, job_id))
     conn.commit()
-    conn.close()
 
-def update_clock_out(user_id, date, clock_out):
-    conn = sqlite3.connect('clock_times.db')
+def remove_job(job_id):
+    conn = get_connection(DB_PATH)
     c = conn.cursor()
-    c.execute("UPDATE clock_times SET clock_out = ? WHERE user_id = ? AND date = ? AND clock_out IS NULL",
-              (clock_out, user_id, date))
+    c.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
     conn.commit()
-    conn.close()
 
-def get_clock_times(user_id, date):
-    conn = sqlite3.connect('clock_times.db')
+def to_timestamp(moment):
+    """Convert a local datetime to the epoch seconds stored in clock_times."""
+    return int(moment.timestamp())
+
+def add_clock_in(guild_id, user_id, clock_in):
+    """Open a session unless the user already has one.
+
+    Returns (True, start_ts) for the new session, or (False, start_ts) of the
+    session that is already open. The unique index on open sessions makes the
+    check and the insert a single atomic statement.
+    """
+    conn = get_connection(DB_PATH)
+    with conn:
+        c = conn.cursor()
+        c.execute("INSERT OR IGNORE INTO clock_times (guild_id, user_id, date, start_ts) VALUES (?, ?, ?, ?) RETURNING start_ts",
+                  (guild_id, user_id, clock_in.strftime("%Y-%m-%d"), to_timestamp(clock_in)))
+        row = c.fetchone()
+        if row:
+            return True, row[0]
+        c.execute("SELECT start_ts FROM clock_times WHERE guild_id = ? AND user_id = ? AND end_ts IS NULL", (guild_id, user_id))
+        return False, c.fetchone()[0]
+
+def add_session(guild_id, user_id, clock_in, clock_out):
+    """Store a finished session in one insert."""
+    conn = get_connection(DB_PATH)
+    with conn:
+        c = conn.cursor()
+        date = clock_in.strftime("%Y-%m-%d")
+        start_ts, end_ts = to_timestamp(clock_in), to_timestamp(clock_out)
+        c.execute("INSERT INTO clock_times (guild_id, user_id, date, start_ts, end_ts, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                  (guild_id, user_id, date, start_ts, end_ts, end_ts - start_ts))
+        _refresh_daily_total(c, guild_id, user_id, date)
+
+def update_clock_out(guild_id, user_id, clock_out, session_id=None):
+    """Close the user's open session (or the given one), whatever day it started on.
+
+    Returns the session's start_ts, or None if there was no open session.
+    """
+    conn = get_connection(DB_PATH)
+    with conn:
+        c = conn.cursor()
+        end_ts = to_timestamp(clock_out)
+        if session_id:
+            c.execute("UPDATE clock_times SET end_ts = ?, duration = ? - start_ts WHERE id = ? AND end_ts IS NULL RETURNING start_ts, date",
+                      (end_ts, end_ts, session_id))
+        else:
+            c.execute("UPDATE clock_times SET end_ts = ?, duration = ? - start_ts WHERE guild_id = ? AND user_id = ? AND end_ts IS NULL RETURNING start_ts, date",
+                      (end_ts, end_ts, guild_id, user_id))
+        row = c.fetchone()
+        if row:
+            _refresh_daily_total(c, guild_id, user_id, row[1])
+    return row[0] if row else None
+
+def get_clock_times(guild_id, user_id, date):
+    """Return (id, start_ts, end_ts, duration) for every session the user started on a date."""
+    conn = get_connection(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT clock_in, clock_out FROM clock_times WHERE user_id = ? AND date = ?", (user_id, date))
+    c.execute("SELECT id, start_ts, end_ts, duration FROM all_sessions WHERE guild_id = ? AND user_id = ? AND date = ? ORDER BY id",
+              (guild_id, user_id, date))
     rows = c.fetchall()
-    conn.close()
     return rows
 
-def get_ongoing_sessions(user_id=None):
-    conn = sqlite3.connect('clock_times.db')
+def round_minutes(minutes):
+    """Round minutes according to the specified rules"""
+    return round(minutes / 5) * 5
+
+def get_worked_report(guild_id, date, user_id=None):
+    """Return the worked time of every user (or one user) on a date using a single query.
+
+    Each entry is (user_id, total_minutes, sessions), where sessions lists
+    (index, start_ts, end_ts, rounded_minutes) for the finished sessions and
+    index is the session's 1-based position for that user and date.
+    """
+    conn = get_connection(DB_PATH)
+    c = conn.cursor()
+    query = "SELECT user_id, start_ts, end_ts, duration FROM all_sessions WHERE guild_id = ? AND date = ?"
+    params = [guild_id, date]
+    if user_id:
+        query += " AND user_id = ?"
+        params.append(user_id)
+    c.execute(query + " ORDER BY user_id, id", params)
+
+    report = []
+    for row_user_id, rows in itertools.groupby(c.fetchall(), key=lambda row: row[0]):
+        total_minutes = 0
+        sessions = []
+        for idx, (_, start_ts, end_ts, duration) in enumerate(rows, start=1):
+            if duration is not None:
+                rounded_minutes = round_minutes(duration / 60)
+                total_minutes += rounded_minutes
+                sessions.append((idx, start_ts, end_ts, rounded_minutes))
+        report.append((row_user_id, total_minutes, sessions))
+    return report
+
+def iter_sessions(guild_id, start_date, end_date):
+    """Yield (id, user_id, date, start_ts, end_ts, duration) for every session between two dates, inclusive.
+
+    Rows are read lazily in index order, so memory use does not grow with the
+    number of sessions.
+    """
+    conn = get_connection(DB_PATH)
+    c = conn.cursor()
+    c.execute("""SELECT id, user_id, date, start_ts, end_ts, duration FROM all_sessions
+                 WHERE guild_id = ? AND date BETWEEN ? AND ? ORDER BY date, id""", (guild_id, start_date, end_date))
+    try:
+        yield from c
+    finally:
+        c.close()
+
+def get_ongoing_sessions(guild_id, user_id=None):
+    """Return (id, user_id, date, start_ts) for every open session in a guild."""
+    conn = get_connection(DB_PATH)
     c = conn.cursor()
     if user_id:
-        c.execute("SELECT user_id, date, clock_in FROM clock_times WHERE user_id = ? AND clock_out IS NULL", (user_id,))
+        c.execute("SELECT id, user_id, date, start_ts FROM clock_times WHERE guild_id = ? AND user_id = ? AND end_ts IS NULL",
+                  (guild_id, user_id))
     else:
-        c.execute("SELECT user_id, date, clock_in FROM clock_times WHERE clock_out IS NULL")
+        c.execute("SELECT id, user_id, date, start_ts FROM clock_times WHERE guild_id = ? AND end_ts IS NULL", (guild_id,))
     rows = c.fetchall()
-    conn.close()
     return rows
 
-def remove_session(user_id, date, clock_in):
-    conn = sqlite3.connect('clock_times.db')
+def remove_session(session_id):
+    conn = get_connection(DB_PATH)
+    with conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM clock_times WHERE id = ? RETURNING guild_id, user_id, date", (session_id,))
+        row = c.fetchone()
+        if row is None:
+            c.execute("DELETE FROM clock_archive WHERE id = ? RETURNING guild_id, user_id, date", (session_id,))
+            row = c.fetchone()
+            if row:
+                _refresh_monthly_totals(c, row[0], row[2][:7])
+        if row:
+            _refresh_daily_total(c, *row)
+
+# daily_totals keeps one row per user and day with the rounded minutes of their
+# finished sessions. Every write that finishes, adds or removes a session
+# refreshes the row it touched, so range reports never read the sessions.
+def _refresh_daily_total(c, guild_id, user_id, date):
+    c.execute("""SELECT COALESCE(SUM(round_minutes(duration / 60.0)), 0), COUNT(duration)
+                 FROM all_sessions WHERE guild_id = ? AND user_id = ? AND date = ?""", (guild_id, user_id, date))
+    minutes, sessions = c.fetchone()
+    if sessions:
+        c.execute("""INSERT INTO daily_totals (guild_id, user_id, date, minutes, sessions) VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT (guild_id, user_id, date) DO UPDATE SET minutes = excluded.minutes, sessions = excluded.sessions""",
+                  (guild_id, user_id, date, minutes, sessions))
+    else:
+        c.execute("DELETE FROM daily_totals WHERE guild_id = ? AND user_id = ? AND date = ?", (guild_id, user_id, date))
+
+def _rebuild_daily_totals(c):
+    c.execute("DELETE FROM daily_totals")
+    c.execute("""INSERT INTO daily_totals (guild_id, user_id, date, minutes, sessions)
+                 SELECT guild_id, user_id, date, SUM(round_minutes(duration / 60.0)), COUNT(duration)
+                 FROM all_sessions WHERE duration IS NOT NULL GROUP BY guild_id, user_id, date""")
+
+def rebuild_daily_totals():
+    """Recompute the daily rollup and the archive's monthly summaries from the stored sessions."""
+    conn = get_connection(DB_PATH)
+    with conn:
+        _rebuild_daily_totals(conn.cursor())
+        _rebuild_monthly_totals(conn.cursor())
+
+def get_range_report(guild_id, start_date, end_date, user_id=None):
+    """Return the worked time of every user (or one user) between two dates, inclusive.
+
+    Each entry is (user_id, total_minutes, days), where days lists (date, minutes)
+    for every day the user worked.
+    """
+    conn = get_connection(DB_PATH)
     c = conn.cursor()
-    c.execute("DELETE FROM clock_times WHERE user_id = ? AND date = ? AND clock_in = ?", (user_id, date, clock_in))
-    conn.commit()
-    conn.close()
+    query = "SELECT user_id, date, minutes FROM daily_totals WHERE guild_id = ? AND date BETWEEN ? AND ?"
+    params = [guild_id, start_date, end_date]
+    if user_id:
+        query += " AND user_id = ?"
+        params.append(user_id)
+    c.execute(query + " ORDER BY user_id, date", params)
 
-def get_punish_count(user_id):
-    conn = sqlite3.connect('punishments.db')
+    report = []
+    for row_user_id, rows in itertools.groupby(c.fetchall(), key=lambda row: row[0]):
+        days = [(date, minutes) for _, date, minutes in rows]
+        report.append((row_user_id, sum(minutes for _, minutes in days), days))
+    return report
+
+def get_leaderboard(guild_id, start_date, end_date, limit=10, ascending=False):
+    """Rank users by worked time between two dates, inclusive, most minutes first (or least if ascending).
+
+    Returns up to `limit` rows of (rank, user_id, total_minutes, days_worked, share),
+    where tied users share a rank and share is their percentage of everyone's minutes.
+    """
+    conn = get_connection(DB_PATH)
+    c = conn.cursor()
+    order = "ASC" if ascending else "DESC"
+    c.execute(f"""WITH totals AS (
+                      SELECT user_id, SUM(minutes) AS minutes, COUNT(*) AS days
+                      FROM daily_totals WHERE guild_id = ? AND date BETWEEN ? AND ? GROUP BY user_id
+                  )
+                  SELECT RANK() OVER (ORDER BY minutes {order}), user_id, minutes, days,
+                         100.0 * minutes / SUM(minutes) OVER ()
+                  FROM totals ORDER BY minutes {order}, user_id LIMIT ?""", (guild_id, start_date, end_date, limit))
+    return c.fetchall()
+
+# Finished sessions older than the retention period are moved from clock_times
+# to clock_archive, one month per transaction, so the hot table and its indexes
+# only hold recent data. Reports read both through the all_sessions view and
+# daily_totals, and monthly_totals keeps a per-user summary of every archived month.
+def _refresh_monthly_totals(c, guild_id, month):
+    c.execute("DELETE FROM monthly_totals WHERE guild_id = ? AND month = ?", (guild_id, month))
+    c.execute("""INSERT INTO monthly_totals (guild_id, month, user_id, minutes, sessions, days)
+                 SELECT guild_id, ?, user_id, SUM(round_minutes(duration / 60.0)), COUNT(*), COUNT(DISTINCT date)
+                 FROM clock_archive WHERE guild_id = ? AND date BETWEEN ? AND ? GROUP BY user_id""",
+              (month, guild_id, f"{month}-01", f"{month}-31"))
+
+def _rebuild_monthly_totals(c):
+    c.execute("DELETE FROM monthly_totals")
+    c.execute("""INSERT INTO monthly_totals (guild_id, month, user_id, minutes, sessions, days)
+                 SELECT guild_id, substr(date, 1, 7), user_id, SUM(round_minutes(duration / 60.0)), COUNT(*), COUNT(DISTINCT date)
+                 FROM clock_archive GROUP BY guild_id, substr(date, 1, 7), user_id""")
+
+def archive_sessions(before_date):
+    """Move the finished sessions that started before a date to the archive.
+
+    Returns the number of sessions moved.
+    """
+    conn = get_connection(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT DISTINCT guild_id, substr(date, 1, 7) FROM clock_times WHERE date < ? AND end_ts IS NOT NULL", (before_date,))
+    moved = 0
+    for guild_id, month in c.fetchall():
+        params = (guild_id, f"{month}-01", f"{month}-31", before_date)
+        with conn:
+            c.execute("""INSERT INTO clock_archive (guild_id, id, user_id, date, start_ts, end_ts, duration)
+                         SELECT guild_id, id, user_id, date, start_ts, end_ts, duration FROM clock_times
+                         WHERE guild_id = ? AND date BETWEEN ? AND ? AND date < ? AND end_ts IS NOT NULL""", params)
+            moved += c.rowcount
+            c.execute("DELETE FROM clock_times WHERE guild_id = ? AND date BETWEEN ? AND ? AND date < ? AND end_ts IS NOT NULL", params)
+            _refresh_monthly_totals(c, guild_id, month)
+    return moved
+
+def get_archive_summary():
+    """Return (hot sessions, months), where months lists (month, users, sessions, minutes) for every archived month.
+
+    Both cover every guild.
+    """
+    conn = get_connection(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM clock_times")
+    hot_sessions = c.fetchone()[0]
+    c.execute("SELECT month, COUNT(*), SUM(sessions), SUM(minutes) FROM monthly_totals GROUP BY month ORDER BY month")
+    return hot_sessions, c.fetchall()
+
+def incremental_vacuum(pages=None):
+    """Return up to `pages` free pages (all of them by default) to the file system.
+
+    Returns the number of pages freed. The WAL is checkpointed afterwards so
+    the file actually shrinks.
+    """
+    conn = get_connection(DB_PATH)
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    # The pragma frees one page per step and returns no rows; executescript steps it to the end
+    conn.executescript(f'PRAGMA incremental_vacuum({int(pages or 0)});')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    return free_pages - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def backup_database(target_path, pages=BACKUP_PAGES):
+    """Copy the database to target_path with SQLite's online backup API and return its page count.
+
+    The copy is made `pages` pages at a time. Each step only holds a read lock,
+    so clocking keeps writing while it runs, and SQLite restarts the copy if
+    another connection changed the database between steps, so the result is
+    always a consistent snapshot. Raises sqlite3.DatabaseError if the copy
+    fails its integrity check.
+    """
+    target = sqlite3.connect(target_path)
+    try:
+        get_connection(DB_PATH).backup(target, pages=pages)
+        # A snapshot is a single self-contained file, not a WAL database
+        target.execute('PRAGMA journal_mode=DELETE')
+        result = target.execute('PRAGMA quick_check').fetchone()[0]
+        page_count = target.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        target.close()
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f"Backup {target_path} failed its integrity check: {result}")
+    return page_count
+
+def restore_database(source_path, pages=BACKUP_PAGES):
+    """Replace the contents of the database with a snapshot made by backup_database.
+
+    The snapshot is copied in through the backup API, so the open connections
+    of every worker see the restored data without reconnecting. A snapshot
+    taken before the latest migrations is migrated afterwards.
+    """
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    try:
+        source.backup(get_connection(DB_PATH), pages=pages)
+    finally:
+        source.close()
+    init_db()
+
+def get_punish_count(guild_id, user_id):
+    conn = get_connection(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("CREATE TABLE IF NOT EXISTS punishments (user_id INTEGER PRIMARY KEY, count INTEGER)")
-    cursor.execute("SELECT count FROM punishments WHERE user_id = ?", (user_id,))
+    cursor.execute("SELECT count FROM punishments WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
     result = cursor.fetchone()
-    conn.close()
     return result[0] if result else 0
 
-def reset_punish_count(user_id):
-    conn = sqlite3.connect('punishments.db')
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE IF NOT EXISTS punishments (user_id INTEGER PRIMARY KEY, count INTEGER)")
-    cursor.execute("UPDATE punishments SET count = 0 WHERE user_id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+def reset_punish_count(guild_id, user_id, issuer_id=None, message=None):
+    """Reset the user's warns count and record the reset in the warning history. Returns the new count."""
+    conn = get_connection(DB_PATH)
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE punishments SET count = 0 WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        cursor.execute("INSERT INTO warnings (guild_id, user_id, issuer_id, kind, message, created_at) VALUES (?, ?, ?, 'reset', ?, ?)",
+                       (guild_id, user_id, issuer_id, message, int(time.time())))
+    return 0
+
+def increment_punish_count(guild_id, user_id, issuer_id=None, message=None, max_count=None):
+    """Add a warning with one atomic upsert and record it in the warning history.
 
-def increment_punish_count(user_id):
-    conn = sqlite3.connect('punishments.db')
+    Returns the new count, or None if the user already has max_count warnings.
+    """
+    conn = get_connection(DB_PATH)
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("""INSERT INTO punishments (guild_id, user_id, count) VALUES (?, ?, 1)
+                          ON CONFLICT (guild_id, user_id) DO UPDATE SET count = count + 1 WHERE ? IS NULL OR count < ?
+                          RETURNING count""", (guild_id, user_id, max_count, max_count))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        cursor.execute("INSERT INTO warnings (guild_id, user_id, issuer_id, kind, message, created_at) VALUES (?, ?, ?, 'warn', ?, ?)",
+                       (guild_id, user_id, issuer_id, message, int(time.time())))
+    return row[0]
+
+def get_warning_history(guild_id, user_id, limit=10):
+    """Return (kind, issuer_id, message, created_at) for the user's latest warnings and resets, newest first."""
+    conn = get_connection(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("CREATE TABLE IF NOT EXISTS punishments (user_id INTEGER PRIMARY KEY, count INTEGER)")
-    current_count = get_punish_count(user_id)
-    new_count = current_count + 1
-    cursor.execute("INSERT OR REPLACE INTO punishments (user_id, count) VALUES (?, ?)", (user_id, new_count))
-    conn.commit()
-    conn.close()
-    return new_count
+    cursor.execute("""SELECT kind, issuer_id, message, created_at FROM warnings
+                      WHERE guild_id = ? AND user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?""", (guild_id, user_id, limit))
+    return cursor.fetchall()
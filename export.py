@@ -0,0 +1,50 @@
+import csv
+import json
+import datetime
+import tempfile
+from database import round_minutes
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+FIELDS = ['session_id', 'user_id', 'date', 'clock_in', 'clock_out', 'duration_minutes', 'rounded_minutes']
+
+def format_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(sep=' ')
+
+def session_records(rows):
+    """Turn stored session rows into export records with computed durations"""
+    for session_id, user_id, date, start_ts, end_ts, duration in rows:
+        yield {
+            'session_id': session_id,
+            'user_id': user_id,
+            'date': date,
+            'clock_in': format_timestamp(start_ts),
+            'clock_out': format_timestamp(end_ts),
+            'duration_minutes': round(duration / 60, 2) if duration is not None else None,
+            'rounded_minutes': round_minutes(duration / 60) if duration is not None else None,
+        }
+
+def write_csv(records, file):
+    writer = csv.DictWriter(file, fieldnames=FIELDS)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+
+def write_jsonl(records, file):
+    for record in records:
+        file.write(json.dumps(record) + "\n")
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+def export_timesheet(rows, export_format='csv'):
+    """Stream session rows into a temporary file and return its path.
+
+    rows is an iterable of (id, user_id, date, start_ts, end_ts, duration), such
+    as the storage backend's iter_sessions(). Rows flow from it through the
+    record and writer generators one at a time, so the full result is never
+    held in memory. The caller deletes the file once it has been uploaded.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix=f'.{export_format}', newline='', encoding='utf-8', delete=False) as file:
+        WRITERS[export_format](session_records(rows), file)
+    return file.name
@@ -0,0 +1,87 @@
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+from metrics import current_command, current_guild
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Fields commands can attach with extra={...}; they are written as JSON keys when set
+STRUCTURED_FIELDS = ('guild_id', 'user_id', 'command', 'date', 'duration')
+
+class CommandFilter(logging.Filter):
+    """Tag every record with the command being handled when it was logged, and the guild it came from"""
+    def filter(self, record):
+        if getattr(record, 'command', None) is None:
+            record.command = current_command.get()
+        if getattr(record, 'guild_id', None) is None:
+            record.guild_id = current_guild.get()
+        return True
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records with the traceback kept apart from the message.
+
+    The stock QueueHandler merges the traceback into the message before
+    queueing, which would leave the JSON formatter no exception to write as its
+    own field. Here it is kept as exc_text, which every formatter appends or
+    writes on the listener side.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None  # the traceback would keep every frame alive until the record is written
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def file_handler(path, max_bytes=10 * 1024 * 1024, backup_count=5, rotate_when=None):
+    """Return a handler that rotates the log file by time when rotate_when is set (e.g. 'midnight'), by size otherwise"""
+    if rotate_when:
+        return logging.handlers.TimedRotatingFileHandler(path, when=rotate_when, backupCount=backup_count, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+
+def setup_logging(handlers, path='bot.log', level=logging.INFO, json_format=False,
+                  max_bytes=10 * 1024 * 1024, backup_count=5, rotate_when=None):
+    """Route the root logger through a queue and return the started listener.
+
+    Logging calls only put the record on an in-memory queue. A listener thread
+    writes it to the rotating log file and passes it to the extra handlers, so
+    no file I/O happens on the event loop. Stop the listener on shutdown to
+    write out the records still queued.
+    """
+    log_file = file_handler(path, max_bytes, backup_count, rotate_when)
+    log_file.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(CommandFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, log_file, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+from collections import Counter
+import database
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Name of the command being handled by the current task, None outside commands.
+# Tasks started while handling a command inherit it.
+current_command = contextvars.ContextVar('current_command', default=None)
+# ID of the guild the current command came from, None outside commands and in DMs
+current_guild = contextvars.ContextVar('current_guild', default=None)
+
+class Histogram:
+    """A latency histogram with fixed buckets, safe to update from any thread"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot counts values above every bucket
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def cumulative(self):
+        """Return (upper bound, number of values at or below it) per bucket, ending with +Inf"""
+        with self.lock:
+            counts = list(self.counts)
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        buckets = self.cumulative()
+        target = fraction * buckets[-1][1]
+        return next(bound for bound, total in buckets if total >= target)
+
+command_latency = {}  # command name -> Histogram
+query_latency = {}  # storage operation -> Histogram
+api_calls = Counter()  # command name (None outside commands) -> Discord API requests
+cooldown_rejections = Counter()  # command name -> requests rejected by a cooldown
+_histograms_lock = threading.Lock()
+
+def _histogram(histograms, name):
+    histogram = histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = histograms.setdefault(name, Histogram())
+    return histogram
+
+def observe_command(name, seconds):
+    _histogram(command_latency, name).observe(seconds)
+
+def observe_query(name, seconds):
+    _histogram(query_latency, name).observe(seconds)
+
+def counted_requests(request):
+    """Wrap discord.py's HTTPClient.request so every API call is counted against the current command"""
+    @functools.wraps(request)
+    async def wrapper(*args, **kwargs):
+        api_calls[current_command.get()] += 1
+        return await request(*args, **kwargs)
+    return wrapper
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _render_histograms(lines, metric, label, histograms, help_text):
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} histogram")
+    for name, histogram in sorted(histograms.items()):
+        labels = f'{label}="{_escape(name)}"'
+        for bound, total in histogram.cumulative():
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {total}')
+        lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+
+def _render_counter(lines, metric, label, counter, help_text):
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} counter")
+    for name, count in sorted(counter.items(), key=lambda item: str(item[0])):
+        lines.append(f'{metric}{{{label}="{_escape(name or "none")}"}} {count}')
+
+def render_prometheus():
+    """Return every metric in the Prometheus text exposition format"""
+    lines = []
+    _render_histograms(lines, 'pontaje_command_duration_seconds', 'command', dict(command_latency),
+                       "Time spent handling a command, including checks and cooldowns.")
+    _render_histograms(lines, 'pontaje_query_duration_seconds', 'query', dict(query_latency),
+                       "Execution time of a storage operation on a database worker.")
+    _render_counter(lines, 'pontaje_discord_api_calls_total', 'command', dict(api_calls),
+                    "Discord API requests, by the command that made them.")
+    _render_counter(lines, 'pontaje_cooldown_rejections_total', 'command', dict(cooldown_rejections),
+                    "Requests rejected by a command cooldown.")
+    open_connections, opened_connections = database.connection_counts()
+    lines.append("# HELP pontaje_db_connections Open SQLite connections.")
+    lines.append("# TYPE pontaje_db_connections gauge")
+    lines.append(f"pontaje_db_connections {open_connections}")
+    lines.append("# HELP pontaje_db_connections_opened_total SQLite connections opened since startup.")
+    lines.append("# TYPE pontaje_db_connections_opened_total counter")
+    lines.append(f"pontaje_db_connections_opened_total {opened_connections}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    """Write the metrics to path, replacing the previous file in one step so scrapers never read half a file"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(render_prometheus())
+    os.replace(temp_path, path)
+
+class MetricsWriter:
+    """Periodically write the metrics to a Prometheus text file from a single task"""
+    def __init__(self, path, interval=60.0):
+        self.path = path
+        self.interval = interval
+        self.task = None
+
+    async def write(self):
+        try:
+            await asyncio.to_thread(write_prometheus, self.path)
+        except OSError:
+            logging.exception(f"Could not write metrics to {self.path}.")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.write()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the write task and write the final values"""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        await self.write()
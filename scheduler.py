@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import json
+import logging
+import time
+from database import GLOBAL_JOB_KINDS
+from async_database import add_job, get_jobs, set_job_next_run, remove_job
+
+def next_occurrence(next_run, interval, now):
+    """Return the first run time of a recurring job that is not in the past, without stepping through missed runs"""
+    if interval <= 0:
+        raise ValueError(f"A recurring job needs a positive interval, not {interval} seconds.")
+    if next_run > now:
+        return next_run
+    missed = (now - next_run) // interval + 1
+    return next_run + missed * interval
+
+class Job:
+    def __init__(self, job_id, guild_id, kind, next_run, interval=None, payload=None):
+        self.id = job_id
+        self.guild_id = guild_id
+        self.kind = kind
+        self.next_run = next_run
+        self.interval = interval
+        self.payload = payload
+
+class Scheduler:
+    """Run persistent jobs from a single timer task.
+
+    Jobs are stored in the jobs table and kept in memory in a min-heap ordered
+    by their next run time, so adding, cancelling and rescheduling a job costs
+    O(log n) no matter how many are scheduled. Every job belongs to a guild.
+    Handlers are registered per job kind and receive the job's guild ID and
+    decoded payload.
+    """
+    def __init__(self):
+        self.handlers = {}
+        self.jobs = {}
+        self.heap = []  # (next_run, job_id); entries of cancelled or rescheduled jobs are skipped when popped
+        self.changed = asyncio.Event()
+        self.task = None
+        self.running = set()  # tasks of the jobs being run, kept so they are not garbage collected before they finish
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def unregister(self, kind):
+        self.handlers.pop(kind, None)
+
+    def push(self, job):
+        self.jobs[job.id] = job
+        heapq.heappush(self.heap, (job.next_run, job.id))
+        self.changed.set()
+
+    async def load(self):
+        """Load stored jobs. Recurring jobs that were due while the bot was offline move to their next run time."""
+        now = int(time.time())
+        for job_id, guild_id, kind, next_run, interval, payload in await get_jobs():
+            if interval is not None and interval <= 0:
+                # It would run again as soon as it ran, so it is dropped instead of stalling every other job
+                logging.error(f"Removed scheduled job {job_id} ({kind}) because its interval of {interval} seconds is not positive.")
+                await remove_job(job_id)
+                continue
+            if interval and next_run <= now:
+                next_run = next_occurrence(next_run, interval, now)
+                await set_job_next_run(job_id, next_run)
+            self.push(Job(job_id, guild_id, kind, next_run, interval, payload))
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def schedule(self, guild_id, kind, first_run, interval=None, payload=None):
+        """Schedule a guild's job from a datetime and an optional timedelta interval, and return its id.
+
+        Raises ValueError if the interval is not at least a second long.
+        """
+        next_run = int(first_run.timestamp())
+        interval = int(interval.total_seconds()) if interval is not None else None
+        if interval is not None:
+            next_run = next_occurrence(next_run, interval, int(time.time()))
+        payload = json.dumps(payload) if payload is not None else None
+        job_id = await add_job(guild_id, kind, next_run, interval, payload)
+        self.push(Job(job_id, guild_id, kind, next_run, interval, payload))
+        return job_id
+
+    async def cancel(self, job_id):
+        """Cancel a job. Returns False if there is no such job."""
+        if self.jobs.pop(job_id, None) is None:
+            return False
+        await remove_job(job_id)
+        self.changed.set()
+        return True
+
+    async def cancel_kind(self, guild_id, kind):
+        for job in self.get_jobs(guild_id, kind):
+            await self.cancel(job.id)
+
+    async def reload(self):
+        """Replace the loaded jobs with the stored ones, after the database was restored from a snapshot"""
+        self.jobs.clear()
+        self.heap.clear()
+        await self.load()
+        self.changed.set()
+
+    def claim(self, guild_id):
+        """Move the loaded jobs stored before jobs belonged to a guild to guild_id, once their rows were claimed"""
+        for job in self.get_jobs(0):
+            if job.kind not in GLOBAL_JOB_KINDS:
+                job.guild_id = guild_id
+
+    def get_jobs(self, guild_id=None, kind=None):
+        jobs = sorted(self.jobs.values(), key=lambda job: job.next_run)
+        return [job for job in jobs if (guild_id is None or job.guild_id == guild_id) and (kind is None or job.kind == kind)]
+
+    def pop_due(self, now):
+        """Pop the next due job, skipping stale heap entries. Returns (job, seconds until the next job)."""
+        while self.heap:
+            next_run, job_id = self.heap[0]
+            job = self.jobs.get(job_id)
+            if job is None or job.next_run != next_run:
+                heapq.heappop(self.heap)
+                continue
+            if next_run > now:
+                return None, next_run - now
+            heapq.heappop(self.heap)
+            return job, 0
+        return None, None
+
+    async def run(self):
+        while True:
+            self.changed.clear()
+            job, delay = self.pop_due(int(time.time()))
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if job.interval:
+                job.next_run = next_occurrence(job.next_run, job.interval, int(time.time()))
+                await set_job_next_run(job.id, job.next_run)
+                self.push(job)
+            else:
+                self.jobs.pop(job.id, None)
+                await remove_job(job.id)
+            task = asyncio.create_task(self.execute(job))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def execute(self, job):
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            logging.error(f"No handler registered for scheduled job {job.id} ({job.kind}).")
+            return
+        try:
+            await handler(job.guild_id, json.loads(job.payload) if job.payload else {})
+        except Exception:
+            logging.exception(f"Scheduled job {job.id} ({job.kind}) failed.")
@@ -0,0 +1,439 @@
+import abc
+import bisect
+import itertools
+import threading
+import time
+import database
+from database import round_minutes, to_timestamp
+
+BACKENDS = ('sqlite', 'memory')
+
+class StorageBackend(abc.ABC):
+    """The storage operations used by the bot, which every backend must provide.
+
+    Method names and return values match the functions in database.py, so the
+    async wrappers in async_database.py can call any backend the same way.
+    """
+    supports_backups = False  # whether backup_database and restore_database can be used
+
+    def init_db(self):
+        pass
+
+    def close(self):
+        pass
+
+    @abc.abstractmethod
+    def claim_unassigned_rows(self, guild_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_guild_settings(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_guild_setting(self, guild_id, name, value):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_base_timestamp(self, guild_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_base_timestamp(self, guild_id, timestamp):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_job(self, guild_id, kind, next_run, interval=None, payload=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_jobs(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_job_next_run(self, job_id, next_run):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove_job(self, job_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_clock_in(self, guild_id, user_id, clock_in):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_session(self, guild_id, user_id, clock_in, clock_out):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update_clock_out(self, guild_id, user_id, clock_out, session_id=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_clock_times(self, guild_id, user_id, date):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_worked_report(self, guild_id, date, user_id=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_sessions(self, guild_id, start_date, end_date):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_ongoing_sessions(self, guild_id, user_id=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove_session(self, session_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def rebuild_daily_totals(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_range_report(self, guild_id, start_date, end_date, user_id=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_leaderboard(self, guild_id, start_date, end_date, limit=10, ascending=False):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def archive_sessions(self, before_date):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_archive_summary(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def incremental_vacuum(self, pages=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def backup_database(self, target_path):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def restore_database(self, source_path):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_punish_count(self, guild_id, user_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def reset_punish_count(self, guild_id, user_id, issuer_id=None, message=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def increment_punish_count(self, guild_id, user_id, issuer_id=None, message=None, max_count=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_warning_history(self, guild_id, user_id, limit=10):
+        raise NotImplementedError
+
+class SQLiteBackend(StorageBackend):
+    """Store everything in one SQLite file through the functions in database.py."""
+    supports_backups = True
+
+    def __init__(self, path=database.DB_PATH):
+        database.configure(path)
+
+    def close(self):
+        database.close_connections()
+
+    init_db = staticmethod(database.init_db)
+    claim_unassigned_rows = staticmethod(database.claim_unassigned_rows)
+    get_guild_settings = staticmethod(database.get_guild_settings)
+    set_guild_setting = staticmethod(database.set_guild_setting)
+    get_base_timestamp = staticmethod(database.get_base_timestamp)
+    set_base_timestamp = staticmethod(database.set_base_timestamp)
+    add_job = staticmethod(database.add_job)
+    get_jobs = staticmethod(database.get_jobs)
+    set_job_next_run = staticmethod(database.set_job_next_run)
+    remove_job = staticmethod(database.remove_job)
+    add_clock_in = staticmethod(database.add_clock_in)
+    add_session = staticmethod(database.add_session)
+    update_clock_out = staticmethod(database.update_clock_out)
+    get_clock_times = staticmethod(database.get_clock_times)
+    get_worked_report = staticmethod(database.get_worked_report)
+    iter_sessions = staticmethod(database.iter_sessions)
+    get_ongoing_sessions = staticmethod(database.get_ongoing_sessions)
+    remove_session = staticmethod(database.remove_session)
+    rebuild_daily_totals = staticmethod(database.rebuild_daily_totals)
+    get_range_report = staticmethod(database.get_range_report)
+    get_leaderboard = staticmethod(database.get_leaderboard)
+    archive_sessions = staticmethod(database.archive_sessions)
+    get_archive_summary = staticmethod(database.get_archive_summary)
+    incremental_vacuum = staticmethod(database.incremental_vacuum)
+    backup_database = staticmethod(database.backup_database)
+    restore_database = staticmethod(database.restore_database)
+    get_punish_count = staticmethod(database.get_punish_count)
+    reset_punish_count = staticmethod(database.reset_punish_count)
+    increment_punish_count = staticmethod(database.increment_punish_count)
+    get_warning_history = staticmethod(database.get_warning_history)
+
+class MemoryBackend(StorageBackend):
+    """Keep everything in process memory, for load tests and benchmarks.
+
+    Sessions are stored by id, which grows with insertion order like the
+    SQLite rowid, and indexed by (guild_id, user_id, date), by guild and date
+    and by open session per guild and user, the same lookups the SQLite
+    indexes serve. Each guild's dates with sessions are kept in a sorted list
+    so range queries bisect instead of scanning. Nothing is written to disk
+    and all data is lost on shutdown, so archiving and vacuuming have nothing
+    to do, there is no file to back up and there are never rows from before
+    guilds were tracked.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.guild_settings = {}  # (guild_id, name) -> value
+        self.base_timestamps = {}  # guild_id -> datetime
+        self.sessions = {}  # id -> [id, user_id, date, start_ts, end_ts, duration, guild_id]
+        self.by_user_date = {}  # (guild_id, user_id, date) -> [session ids]
+        self.by_date = {}  # (guild_id, date) -> [session ids]
+        self.dates = {}  # guild_id -> sorted dates in by_date
+        self.open_sessions = {}  # (guild_id, user_id) -> id of the open session
+        self.daily_totals = {}  # (guild_id, date) -> {user_id: minutes}
+        self.session_ids = itertools.count(1)
+        self.jobs = {}  # id -> (id, guild_id, kind, next_run, interval, payload)
+        self.job_ids = itertools.count(1)
+        self.punishments = {}  # (guild_id, user_id) -> count
+        self.warnings = {}  # (guild_id, user_id) -> [(kind, issuer_id, message, created_at)], oldest first
+
+    def claim_unassigned_rows(self, guild_id):
+        return 0
+
+    def get_guild_settings(self):
+        with self.lock:
+            return [(guild_id, name, value) for (guild_id, name), value in self.guild_settings.items()]
+
+    def set_guild_setting(self, guild_id, name, value):
+        with self.lock:
+            if value is None:
+                self.guild_settings.pop((guild_id, name), None)
+            else:
+                self.guild_settings[(guild_id, name)] = value
+
+    def get_base_timestamp(self, guild_id):
+        return self.base_timestamps.get(guild_id)
+
+    def set_base_timestamp(self, guild_id, timestamp):
+        with self.lock:
+            if timestamp is None:
+                self.base_timestamps.pop(guild_id, None)
+            else:
+                self.base_timestamps[guild_id] = timestamp
+
+    def add_job(self, guild_id, kind, next_run, interval=None, payload=None):
+        with self.lock:
+            job_id = next(self.job_ids)
+            self.jobs[job_id] = (job_id, guild_id, kind, next_run, interval, payload)
+            return job_id
+
+    def get_jobs(self):
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda job: job[3])
+
+    def set_job_next_run(self, job_id, next_run):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job:
+                self.jobs[job_id] = job[:3] + (next_run,) + job[4:]
+
+    def remove_job(self, job_id):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def _insert(self, guild_id, user_id, date, start_ts, end_ts=None):
+        session_id = next(self.session_ids)
+        duration = end_ts - start_ts if end_ts is not None else None
+        self.sessions[session_id] = [session_id, user_id, date, start_ts, end_ts, duration, guild_id]
+        self.by_user_date.setdefault((guild_id, user_id, date), []).append(session_id)
+        if (guild_id, date) not in self.by_date:
+            self.by_date[(guild_id, date)] = []
+            bisect.insort(self.dates.setdefault(guild_id, []), date)
+        self.by_date[(guild_id, date)].append(session_id)
+        if end_ts is None:
+            self.open_sessions[(guild_id, user_id)] = session_id
+        return session_id
+
+    def _refresh_daily_total(self, guild_id, user_id, date):
+        durations = [self.sessions[session_id][5] for session_id in self.by_user_date.get((guild_id, user_id, date), ())]
+        durations = [duration for duration in durations if duration is not None]
+        totals = self.daily_totals.setdefault((guild_id, date), {})
+        if durations:
+            totals[user_id] = sum(round_minutes(duration / 60) for duration in durations)
+        else:
+            totals.pop(user_id, None)
+
+    def add_clock_in(self, guild_id, user_id, clock_in):
+        with self.lock:
+            session_id = self.open_sessions.get((guild_id, user_id))
+            if session_id is not None:
+                return False, self.sessions[session_id][3]
+            start_ts = to_timestamp(clock_in)
+            self._insert(guild_id, user_id, clock_in.strftime("%Y-%m-%d"), start_ts)
+            return True, start_ts
+
+    def add_session(self, guild_id, user_id, clock_in, clock_out):
+        with self.lock:
+            date = clock_in.strftime("%Y-%m-%d")
+            self._insert(guild_id, user_id, date, to_timestamp(clock_in), to_timestamp(clock_out))
+            self._refresh_daily_total(guild_id, user_id, date)
+
+    def update_clock_out(self, guild_id, user_id, clock_out, session_id=None):
+        with self.lock:
+            if session_id is None:
+                session_id = self.open_sessions.get((guild_id, user_id))
+            session = self.sessions.get(session_id)
+            if session is None or session[4] is not None:
+                return None
+            end_ts = to_timestamp(clock_out)
+            session[4], session[5] = end_ts, end_ts - session[3]
+            self.open_sessions.pop((session[6], session[1]), None)
+            self._refresh_daily_total(session[6], session[1], session[2])
+            return session[3]
+
+    def get_clock_times(self, guild_id, user_id, date):
+        with self.lock:
+            sessions = [self.sessions[session_id] for session_id in self.by_user_date.get((guild_id, user_id, date), ())]
+            return [(session_id, start_ts, end_ts, duration) for session_id, _, _, start_ts, end_ts, duration, _ in sessions]
+
+    def get_worked_report(self, guild_id, date, user_id=None):
+        with self.lock:
+            sessions = [self.sessions[session_id] for session_id in self.by_date.get((guild_id, date), ())]
+        sessions = sorted((session for session in sessions if not user_id or session[1] == user_id),
+                          key=lambda session: (session[1], session[0]))
+
+        report = []
+        for row_user_id, rows in itertools.groupby(sessions, key=lambda session: session[1]):
+            total_minutes = 0
+            entries = []
+            for idx, (_, _, _, start_ts, end_ts, duration, _) in enumerate(rows, start=1):
+                if duration is not None:
+                    rounded_minutes = round_minutes(duration / 60)
+                    total_minutes += rounded_minutes
+                    entries.append((idx, start_ts, end_ts, rounded_minutes))
+            report.append((row_user_id, total_minutes, entries))
+        return report
+
+    def _dates_between(self, guild_id, start_date, end_date):
+        dates = self.dates.get(guild_id, [])
+        return dates[bisect.bisect_left(dates, start_date):bisect.bisect_right(dates, end_date)]
+
+    def iter_sessions(self, guild_id, start_date, end_date):
+        with self.lock:
+            rows = [tuple(self.sessions[session_id][:6])
+                    for date in self._dates_between(guild_id, start_date, end_date)
+                    for session_id in self.by_date[(guild_id, date)]]
+        yield from rows
+
+    def get_ongoing_sessions(self, guild_id, user_id=None):
+        with self.lock:
+            if user_id:
+                session_id = self.open_sessions.get((guild_id, user_id))
+                session_ids = [session_id] if session_id is not None else []
+            else:
+                session_ids = [session_id for (session_guild_id, _), session_id in self.open_sessions.items()
+                               if session_guild_id == guild_id]
+            return [tuple(self.sessions[session_id][:4]) for session_id in session_ids]
+
+    def remove_session(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                return
+            _, user_id, date, _, end_ts, _, guild_id = session
+            self.by_user_date[(guild_id, user_id, date)].remove(session_id)
+            self.by_date[(guild_id, date)].remove(session_id)
+            if end_ts is None:
+                self.open_sessions.pop((guild_id, user_id), None)
+            self._refresh_daily_total(guild_id, user_id, date)
+
+    def rebuild_daily_totals(self):
+        with self.lock:
+            self.daily_totals = {}
+            for guild_id, user_id, date in self.by_user_date:
+                self._refresh_daily_total(guild_id, user_id, date)
+
+    def get_range_report(self, guild_id, start_date, end_date, user_id=None):
+        days_by_user = {}
+        with self.lock:
+            for date in self._dates_between(guild_id, start_date, end_date):
+                for row_user_id, minutes in self.daily_totals.get((guild_id, date), {}).items():
+                    if not user_id or row_user_id == user_id:
+                        days_by_user.setdefault(row_user_id, []).append((date, minutes))
+        return [(row_user_id, sum(minutes for _, minutes in days), days)
+                for row_user_id, days in sorted(days_by_user.items())]
+
+    def get_leaderboard(self, guild_id, start_date, end_date, limit=10, ascending=False):
+        totals = {}
+        with self.lock:
+            for date in self._dates_between(guild_id, start_date, end_date):
+                for user_id, minutes in self.daily_totals.get((guild_id, date), {}).items():
+                    total, days = totals.get(user_id, (0, 0))
+                    totals[user_id] = (total + minutes, days + 1)
+        grand_total = sum(minutes for minutes, _ in totals.values())
+        ordered = sorted(totals.items(), key=lambda item: (item[1][0] if ascending else -item[1][0], item[0]))
+
+        leaderboard = []
+        for position, (user_id, (minutes, days)) in enumerate(ordered[:limit], start=1):
+            # Like RANK(), tied users share the rank of the first of them
+            rank = leaderboard[-1][0] if leaderboard and leaderboard[-1][2] == minutes else position
+            share = 100.0 * minutes / grand_total if grand_total else None
+            leaderboard.append((rank, user_id, minutes, days, share))
+        return leaderboard
+
+    def archive_sessions(self, before_date):
+        return 0
+
+    def get_archive_summary(self):
+        with self.lock:
+            return len(self.sessions), []
+
+    def incremental_vacuum(self, pages=None):
+        return 0
+
+    def backup_database(self, target_path):
+        raise ValueError("Backups are not supported for the memory backend, it keeps no database file.")
+
+    def restore_database(self, source_path):
+        raise ValueError("Backups are not supported for the memory backend, it keeps no database file.")
+
+    def get_punish_count(self, guild_id, user_id):
+        return self.punishments.get((guild_id, user_id), 0)
+
+    def reset_punish_count(self, guild_id, user_id, issuer_id=None, message=None):
+        with self.lock:
+            if (guild_id, user_id) in self.punishments:
+                self.punishments[(guild_id, user_id)] = 0
+            self.warnings.setdefault((guild_id, user_id), []).append(('reset', issuer_id, message, int(time.time())))
+        return 0
+
+    def increment_punish_count(self, guild_id, user_id, issuer_id=None, message=None, max_count=None):
+        with self.lock:
+            count = self.punishments.get((guild_id, user_id), 0)
+            if (guild_id, user_id) in self.punishments and max_count is not None and count >= max_count:
+                return None
+            self.punishments[(guild_id, user_id)] = count + 1
+            self.warnings.setdefault((guild_id, user_id), []).append(('warn', issuer_id, message, int(time.time())))
+            return count + 1
+
+    def get_warning_history(self, guild_id, user_id, limit=10):
+        with self.lock:
+            return list(reversed(self.warnings.get((guild_id, user_id), [])[-limit:]))
+
+def create_backend(name='sqlite', path=database.DB_PATH):
+    """Create the storage backend configured by name."""
+    if name == 'sqlite':
+        return SQLiteBackend(path)
+    if name == 'memory':
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend {name!r}, expected one of {', '.join(BACKENDS)}")